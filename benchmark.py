@@ -0,0 +1,579 @@
+"""
+Benchmarks for the term rewriter. Run ``python benchmark.py`` to time the workload from :py:mod:`main` with the
+kernel's rule dispatch table, with a plain linear scan over all rules and with a frozen rule set of several thousand
+rules, to time the matching of long ``Orderless`` and ``Orderless`` ``Flat`` functions, to count the match attempts
+saved by pattern fingerprints, to measure the time spent in garbage collection, the memory used by repeated
+subexpressions, the time taken to put the arguments of ``Orderless`` functions into canonical order, the effect of
+the evaluation cache, the number of rule attempts needed for large expressions, the evaluation of deeply nested
+expressions, the overhead of evaluation budgets and tracing, the rules that cost the most and the effect of reordering
+the rules by their hits, the time spent checking guards, the cost of ``FreeQ`` tests on large expressions, the
+construction of rule results, the memory taken by the nodes of large expressions, substitutions that leave most of
+an expression unchanged, the rebuilding of functions from evaluated arguments, exact arithmetic on large numbers
+and the folding of the numeric arguments of long sums and products.
+"""
+import gc
+import sys
+import tracemalloc
+from time import perf_counter
+from fractions import Fraction
+from expressions import Function, Symbol, Integer, Rational, Sequence, BoundPattern, Blank, Bindings, Attribute
+from evaluation import Kernel, SubstitutionRule, Budget, CancellationToken, filter_statistics
+from initialize_rules import kernel
+from tracing import RingBufferTracer
+
+
+def workload():
+    """
+    Returns the expression evaluated by :py:mod:`main`: ``D[Sin[Exp[Plus[1, a]]], a]``.
+    """
+    return Function('D', Sequence([Function('Sin', Sequence([Function('Exp', Sequence([Function('Plus', Sequence(
+        [Integer(1), Symbol('a')]))]))])), Symbol('a')]))
+
+
+def measure(evaluating_kernel=kernel, repeat=20, setup=None):
+    """
+    Evaluates the workload *repeat* times and returns the best time in seconds. Expressions are interned, so the
+    workload is the same expression every time. The kernel forgets its earlier results before every run, so that
+    every run starts from scratch. *setup* is called without arguments before every run.
+    """
+    best = None
+    for _ in range(repeat):
+        expression = workload()
+        evaluating_kernel.invalidate()
+        if setup is not None:
+            setup()
+        start = perf_counter()
+        evaluating_kernel.evaluate(expression)
+        elapsed = perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def benchmark_dispatch():
+    """
+    Compares the rule dispatch table against trying every rule of the kernel for every expression.
+    """
+    indexed = measure()
+    kernel.candidate_rules = lambda expression: kernel.rules
+    try:
+        linear = measure()
+    finally:
+        del kernel.candidate_rules
+    print('rule dispatch:  linear scan %.2f ms, dispatch table %.2f ms, speedup %.1fx' % (
+        linear * 1000, indexed * 1000, linear / indexed))
+
+
+def benchmark_net(size=3000):
+    """
+    Puts *size* rules of the form ``D[f[y_], x_] -> 0`` with distinct heads ``f`` in front of the default rules, so
+    that they all share one bucket of the dispatch table, and compares the dispatch table against the frozen
+    discrimination net.
+    """
+    large_kernel = Kernel()
+    for i in range(size):
+        large_kernel.add_rule(SubstitutionRule(Function('D', Sequence([Function('f' + str(i), Sequence(
+            [BoundPattern('y', Blank())])), BoundPattern('x', Blank())])), Integer(0)))
+    for rule in kernel.rules:
+        large_kernel.add_rule(rule)
+    indexed = measure(large_kernel, 5)
+    large_kernel.freeze()
+    frozen = measure(large_kernel, 5)
+    print('%d rules:     dispatch table %.2f ms, discrimination net %.2f ms, speedup %.1fx' % (
+        len(large_kernel.rules), indexed * 1000, frozen * 1000, indexed / frozen))
+
+
+def benchmark_orderless(sizes=(10, 20, 50)):
+    """
+    Matches ``Bag[f1[a_], ..., fn[a_]]`` against ``Bag`` functions of the same length whose arguments are in reverse
+    order, once with a match and once with the last argument spoiled so that no match exists. ``Bag`` is ``Orderless``
+    but not ``Flat``, so the arguments are matched by the :py:class:`~expressions.OrderlessSequenceMatcher`.
+    """
+    for size in sizes:
+        pattern = Function('Bag', Sequence([Function('f' + str(i), Sequence([BoundPattern('a', Blank())]))
+                                            for i in range(size)]), Attribute.Orderless)
+        arguments = [Function('f' + str(i), Sequence([Integer(1)])) for i in reversed(range(size))]
+        matching = Function('Bag', Sequence(arguments), Attribute.Orderless)
+        failing = Function('Bag', Sequence([Function('f0', Sequence([Integer(2)]))] + arguments[:-1]),
+                           Attribute.Orderless)
+        start = perf_counter()
+        found = len(list(pattern.match(matching, Bindings())))
+        middle = perf_counter()
+        missed = len(list(pattern.match(failing, Bindings())))
+        end = perf_counter()
+        print('orderless %2d:   %d match in %.2f ms, %d matches in %.2f ms' % (
+            size, found, (middle - start) * 1000, missed, (end - middle) * 1000))
+
+
+def benchmark_orderless_flat(sizes=(10, 20, 50)):
+    """
+    Matches the pattern ``Plus[a_, a_, b_]`` of the default rules against sums of distinct symbols, once with one
+    symbol occurring twice and once without any repeated term.
+    """
+    pattern = Function('Plus', Sequence([BoundPattern('a', Blank()), BoundPattern('a', Blank()),
+                                         BoundPattern('b', Blank())]))
+    for size in sizes:
+        symbols = [Symbol('x' + str(i)) for i in range(size)]
+        repeated = Function('Plus', Sequence(symbols + [symbols[size // 2]]))
+        distinct = Function('Plus', Sequence(symbols))
+        start = perf_counter()
+        for match in pattern.match(repeated, Bindings()):
+            break
+        middle = perf_counter()
+        missed = len(list(pattern.match(distinct, Bindings())))
+        end = perf_counter()
+        print('orderless flat %2d: first match in %.2f ms, %d matches in %.2f ms' % (
+            size, (middle - start) * 1000, missed, (end - middle) * 1000))
+
+
+def benchmark_fingerprints():
+    """
+    Evaluates the workload once and reports how many rule applications were rejected by comparing fingerprints. The
+    counters are only updated while the kernel is profiling.
+    """
+    filter_statistics.reset()
+    kernel.invalidate()
+    kernel.enable_profiling()
+    try:
+        kernel.evaluate(workload())
+    finally:
+        kernel.disable_profiling()
+    print('fingerprints:   %d of %d match attempts saved' % (filter_statistics.rejected, filter_statistics.checked))
+
+
+def benchmark_garbage_collection(repeat=200):
+    """
+    Evaluates the workload *repeat* times and reports how often the garbage collector ran and how long it took.
+    """
+    collections = []
+
+    def callback(phase, info):
+        collections.append((phase, perf_counter()))
+
+    gc.collect()
+    gc.callbacks.append(callback)
+    try:
+        start = perf_counter()
+        for _ in range(repeat):
+            kernel.invalidate()
+            kernel.evaluate(workload())
+        total = perf_counter() - start
+    finally:
+        gc.callbacks.remove(callback)
+    collected = sum(stop - begin for (_, begin), (_, stop) in zip(collections[::2], collections[1::2]))
+    print('garbage collection: %d collections, %.2f ms of %.2f ms total' % (
+        len(collections) // 2, collected * 1000, total * 1000))
+
+
+def benchmark_interning(size=2000):
+    """
+    Builds a product of *size* arguments that all are the workload expression, constructed anew every time, and reports
+    the memory it takes. Interned expressions share the repeated arguments.
+    """
+    tracemalloc.start()
+    expression = Function('Times', Sequence([workload() for _ in range(size)]))
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('interning:      %d copies of the workload take %.1f KB' % (
+        len(expression.argument_sequence), memory / 1024))
+
+
+def benchmark_canonical_order(size=2000, depth=20):
+    """
+    Builds a ``Plus`` of *size* distinct arguments, each nested *depth* functions deep, in reverse canonical order and
+    then rebuilds it from its already sorted arguments.
+    """
+    arguments = []
+    for i in range(size):
+        argument = Symbol('x' + str(i))
+        for _ in range(depth):
+            argument = Function('f', Sequence([argument]))
+        arguments.append(argument)
+    arguments.sort(key=lambda argument: argument.sort_key(), reverse=True)
+    start = perf_counter()
+    expression = Function('Plus', Sequence(arguments))
+    middle = perf_counter()
+    Function('Plus', Sequence(list(expression.argument_sequence.expressions)))
+    end = perf_counter()
+    print('canonical order: sorting %d arguments %.2f ms, rebuilding %.2f ms' % (
+        size, (middle - start) * 1000, (end - middle) * 1000))
+
+
+def benchmark_cache(repeat=20, copies=20):
+    """
+    Compares evaluating with and without the evaluation cache: the workload with an empty cache, the workload again
+    with the cache its previous evaluation filled, as a repeated request finds it, and a function whose *copies*
+    arguments each wrap the workload, so that all copies but the first are found in the cache.
+    """
+    def copied():
+        return Function('List', Sequence([Function('f' + str(i), Sequence([workload()])) for i in range(copies)]))
+
+    def best_time(build, clear):
+        best = None
+        for _ in range(repeat):
+            # A filled cache is kept, everything else starts from scratch.
+            if clear or kernel.cache is None:
+                kernel.invalidate()
+            expression = build()
+            start = perf_counter()
+            kernel.evaluate(expression)
+            elapsed = perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        return best
+
+    cases = [('empty', workload, True), ('filled', workload, False), ('%d copies' % copies, copied, True)]
+    uncached = [best_time(build, clear) for _, build, clear in cases]
+    cache = kernel.enable_cache()
+    try:
+        for (name, build, clear), plain in zip(cases, uncached):
+            cache.clear()
+            cache.reset()
+            cached = best_time(build, clear)
+            print('evaluation cache: %-9s uncached %.2f ms, cached %.2f ms, speedup %.1fx, %.1f hits per evaluation' % (
+                name, plain * 1000, cached * 1000, plain / cached, cache.hits / repeat))
+    finally:
+        kernel.disable_cache()
+
+
+def benchmark_rule_attempts(sizes=(5, 10, 20)):
+    """
+    Evaluates sums of *size* derivatives of the form ``D[Times[Sin[Power[x, i]], Log[Plus[x, i]]], x]`` and reports
+    how many rules were tried. The rules are counted in a profiled evaluation and the time is taken from a separate
+    evaluation without profiling. Both start without normal form marks.
+    """
+    x = Symbol('x')
+    for size in sizes:
+        expression = Function('Plus', Sequence([Function('D', Sequence([Function('Times', Sequence([
+            Function('Sin', Sequence([Function('Power', Sequence([x, Integer(i)]))])),
+            Function('Log', Sequence([Function('Plus', Sequence([x, Integer(i)]))]))])), x]))
+            for i in range(1, size + 1)]))
+        filter_statistics.reset()
+        kernel.invalidate()
+        kernel.enable_profiling()
+        try:
+            kernel.evaluate(expression)
+        finally:
+            kernel.disable_profiling()
+        kernel.invalidate()
+        start = perf_counter()
+        kernel.evaluate(expression)
+        elapsed = perf_counter() - start
+        print('rule attempts %2d: %d rules tried in %.2f ms' % (size, filter_statistics.checked, elapsed * 1000))
+
+
+def benchmark_deep(depths=(10000, 100000), orderless_depths=(2000, 8000)):
+    """
+    Evaluates towers ``Power[Power[...Power[x, 1]..., 1], 1]`` of the given depths, which collapse to ``x`` one level
+    at a time, and converts them to strings. Then builds nested ``Orderless`` functions
+    ``Plus[Sin[Plus[Sin[...], y]], y]``, whose arguments are put into canonical order at every level.
+    """
+    for depth in depths:
+        expression = Symbol('x')
+        for _ in range(depth):
+            expression = Function('Power', Sequence([expression, Integer(1)]))
+        start = perf_counter()
+        kernel.evaluate(expression)
+        middle = perf_counter()
+        str(expression)
+        end = perf_counter()
+        print('depth %6d:   evaluated in %.2f ms, converted to a string in %.2f ms' % (
+            depth, (middle - start) * 1000, (end - middle) * 1000))
+    for depth in orderless_depths:
+        start = perf_counter()
+        expression = Symbol('x')
+        for _ in range(depth):
+            expression = Function('Plus', Sequence([Function('Sin', Sequence([expression])), Symbol('y')]))
+        end = perf_counter()
+        print('depth %6d:   nested Orderless functions built in %.2f ms' % (depth, (end - start) * 1000))
+
+
+def benchmark_budget(repeat=20):
+    """
+    Evaluates the workload with a budget that never runs out and compares it against evaluating without a budget.
+    """
+    unlimited = measure(repeat=repeat)
+    best = None
+    for _ in range(repeat):
+        expression = workload()
+        budget = Budget(max_rewrites=10 ** 6, max_size=10 ** 6, timeout=60, token=CancellationToken())
+        kernel.invalidate()
+        start = perf_counter()
+        kernel.evaluate(expression, budget)
+        elapsed = perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    print('budget:         without %.2f ms, with %.2f ms' % (unlimited * 1000, best * 1000))
+
+
+def benchmark_tracing():
+    """
+    Evaluates the workload while recording the rewrites in a :py:class:`~tracing.RingBufferTracer` and compares it
+    against evaluating without a tracer. Every run gets a new tracer, since the recorded rewrites would keep the
+    expressions of the earlier runs alive.
+    """
+    untraced = measure()
+    tracers = []
+
+    def new_tracer():
+        tracers[:] = [RingBufferTracer()]
+        kernel.tracer = tracers[0]
+    try:
+        traced = measure(setup=new_tracer)
+    finally:
+        kernel.tracer = None
+    print('tracing:        without %.2f ms, with %.2f ms, %d rewrites recorded per run' % (
+        untraced * 1000, traced * 1000, len(tracers[0])))
+
+
+def benchmark_profile(size=10, limit=5):
+    """
+    Profiles the evaluation of a sum of *size* derivatives and shows the *limit* rules that took the most time.
+    """
+    x = Symbol('x')
+    expression = Function('Plus', Sequence([Function('D', Sequence([Function('Sin', Sequence([
+        Function('Power', Sequence([x, Integer(i)]))])), x])) for i in range(1, size + 1)]))
+    kernel.invalidate()
+    profiler = kernel.enable_profiling()
+    try:
+        kernel.evaluate(expression)
+    finally:
+        kernel.disable_profiling()
+    print('most expensive rules:')
+    print(profiler.table(limit=limit))
+
+
+def benchmark_reordering(size=10):
+    """
+    Profiles a sum of *size* derivatives with a copy of the default rules, reorders the rules by their hits and
+    compares the number of rules tried before and after.
+    """
+    x = Symbol('x')
+    expression = Function('Plus', Sequence([Function('D', Sequence([Function('Times', Sequence([
+        Function('Sin', Sequence([Function('Power', Sequence([x, Integer(i)]))])),
+        Function('Log', Sequence([Function('Plus', Sequence([x, Integer(i)]))]))])), x]))
+        for i in range(1, size + 1)]))
+    tuned_kernel = Kernel()
+    for rule in kernel.rules:
+        tuned_kernel.add_rule(rule)
+    profiler = tuned_kernel.enable_profiling()
+    tuned_kernel.evaluate(expression)
+    tuned_kernel.disable_profiling()
+    attempts = sum(profile.attempts for profile in profiler.profiles.values())
+    tuned_kernel.reorder_rules(profiler)
+    profiler = tuned_kernel.enable_profiling()
+    tuned_kernel.evaluate(expression)
+    reordered = sum(profile.attempts for profile in profiler.profiles.values())
+    print('reordering:     %d rules tried in insertion order, %d after reordering' % (attempts, reordered))
+
+
+def benchmark_guards(size=20):
+    """
+    Profiles a sum of *size* derivatives, whose rules check ``ConstantQ`` guards, and reports the time spent in
+    guards.
+    """
+    x = Symbol('x')
+    expression = Function('Plus', Sequence([Function('D', Sequence([Function('Times', Sequence([
+        Function('Sin', Sequence([Function('Power', Sequence([x, Integer(i)]))])),
+        Function('Log', Sequence([Function('Plus', Sequence([x, Integer(i)]))]))])), x]))
+        for i in range(1, size + 1)]))
+    kernel.invalidate()
+    profiler = kernel.enable_profiling()
+    try:
+        kernel.evaluate(expression)
+    finally:
+        kernel.disable_profiling()
+    profiles = profiler.profiles.values()
+    print('guards:         %d guards checked in %.2f ms' % (
+        sum(profile.guard_evaluations for profile in profiles), sum(profile.guard_time for profile in profiles) * 1000))
+
+
+def benchmark_free_symbols(depth=10000, queries=10000):
+    """
+    Builds an expression nested *depth* functions deep and times the first ``FreeQ`` test, which computes the free
+    symbols of every node, against *queries* further tests, which only look up the cached set.
+    """
+    expression = Symbol('x')
+    for i in range(depth):
+        expression = Function('f', Sequence([expression, Integer(i)]))
+    y = Symbol('y')
+    start = perf_counter()
+    expression.free_of(y)
+    middle = perf_counter()
+    for _ in range(queries):
+        expression.free_of(y)
+    end = perf_counter()
+    print('free symbols:   first test %.2f ms, %d more tests %.2f ms' % (
+        (middle - start) * 1000, queries, (end - middle) * 1000))
+
+
+def benchmark_templates(repeat=2000, rounds=7):
+    """
+    Builds the result of the rule for ``D[Power[a, b], x]`` by substituting the bindings into its template and with
+    its compiled builder, and reports the best of *rounds* rounds. The results are dropped, so every round constructs
+    them anew.
+    """
+    rule = next(rule for rule in kernel.rules if str(rule).startswith('D[Power['))
+    x = Symbol('x')
+    expression = Function('D', Sequence([Function('Power', Sequence([Function('Sin', Sequence([x])), Function(
+        'Cos', Sequence([x]))])), x]))
+    bindings = next(rule.pattern.match(expression, Bindings()))
+
+    def best_time(build):
+        best = None
+        for _ in range(rounds):
+            start = perf_counter()
+            for _ in range(repeat):
+                build(bindings)
+            elapsed = perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        return best / repeat
+
+    substituted = best_time(rule.substitution.substitute)
+    built = best_time(rule.build)
+    print('rule results:   substitute %.1f us, builder %.1f us, %.0f%% saved' % (
+        substituted * 10 ** 6, built * 10 ** 6, (1 - built / substituted) * 100))
+
+
+def benchmark_memory(size=20000):
+    """
+    Builds a ``Plus`` of *size* distinct terms ``Times[i, Power[x_i, i + 1]]`` and reports the memory per node, both
+    for the node objects alone and in total, including the intern table and cached sort keys.
+    """
+    gc.collect()
+    tracemalloc.start()
+    expression = Function('Plus', Sequence([Function('Times', Sequence([Integer(i), Function('Power', Sequence(
+        [Symbol('x' + str(i)), Integer(i + 1)]))])) for i in range(size)]))
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    nodes = {}
+    stack = [expression]
+    while stack:
+        node = stack.pop()
+        if id(node) not in nodes:
+            nodes[id(node)] = node
+            stack.extend(node._parts())
+            if isinstance(node, Function):
+                stack.append(node.argument_sequence)
+    objects = sum(sys.getsizeof(node) for node in nodes.values())
+    print('memory:         %d nodes, %.1f bytes per node object, %.1f bytes per node in total' % (
+        len(nodes), objects / len(nodes), memory / len(nodes)))
+
+
+def benchmark_substitute(size=20000):
+    """
+    Substitutes into a ``Plus`` of *size* functions ``f[x_i, i]``, first with bindings for a symbol that doesn't occur
+    in it and then with bindings for one of the ``x_i``. Unchanged subexpressions are shared with the result.
+    """
+    expression = Function('Plus', Sequence([Function('f', Sequence([Symbol('x' + str(i)), Integer(i)]))
+                                            for i in range(size)]))
+    expression.free_symbols()
+    bindings = Bindings().bind('y', Integer(1))
+    start = perf_counter()
+    expression.substitute(bindings)
+    middle = perf_counter()
+    expression.substitute(bindings.bind('x5', Integer(7)))
+    end = perf_counter()
+    print('substitute:     nothing bound %.2f ms, one argument bound %.2f ms' % (
+        (middle - start) * 1000, (end - middle) * 1000))
+
+
+def benchmark_rebuild(size=2000, depth=5, repeat=20):
+    """
+    Replaces one argument of a ``Plus`` of *size* arguments nested *depth* functions deep by one that sorts into the
+    same place and builds the new function, once normalizing all arguments like the constructor does and once only
+    checking the replaced argument like the kernel does.
+    """
+    arguments = []
+    for i in range(size):
+        argument = Symbol('x' + str(i))
+        for _ in range(depth):
+            argument = Function('f', Sequence([argument]))
+        arguments.append(argument)
+    expression = Function('Plus', Sequence(arguments))
+    parts = [expression.head, *expression.argument_sequence.expressions]
+    # Appending '!' to the name of the symbol of an argument keeps its place in canonical order.
+    name = next(symbol.name for symbol in parts[size // 2].free_symbols() if symbol.name != 'f')
+    argument = Symbol(name + '!')
+    for _ in range(depth):
+        argument = Function('f', Sequence([argument]))
+    parts[size // 2] = argument
+    start = perf_counter()
+    for _ in range(repeat):
+        Function(parts[0], Sequence(parts[1:]))
+    middle = perf_counter()
+    for _ in range(repeat):
+        Function._rebuild(expression, parts)
+    end = perf_counter()
+    print('rebuild:        normalizing %.2f ms, checking the replaced argument %.2f ms' % (
+        (middle - start) / repeat * 1000, (end - middle) / repeat * 1000))
+
+
+def benchmark_numbers(terms=2000, digits=10000):
+    """
+    Sums the harmonic series up to *terms* exactly and adds, multiplies and divides two rationals of *digits* digits,
+    checking the results against :py:class:`fractions.Fraction`.
+    """
+    start = perf_counter()
+    total = Integer(0)
+    for i in range(1, terms + 1):
+        total = total + Rational(Integer(1), Integer(i))
+    middle = perf_counter()
+    expected = sum(Fraction(1, i) for i in range(1, terms + 1))
+    exact = (total.numerator.value, total.denominator.value) == (expected.numerator, expected.denominator)
+    first = Rational(Integer(10 ** digits // 3 + 1), Integer(10 ** digits // 7 + 3))
+    second = Rational(Integer(10 ** digits // 11 + 5), Integer(10 ** digits // 13 + 2))
+    middle_two = perf_counter()
+    quotient = (first + second) * first / second
+    end = perf_counter()
+
+    def fraction(number):
+        return Fraction(number.numerator.value, number.denominator.value)
+    exact = exact and fraction(quotient) == (fraction(first) + fraction(second)) * fraction(first) / fraction(second)
+    print('numbers:        harmonic sum of %d terms %.2f ms, %d digit rationals %.2f ms, exact: %s' % (
+        terms, (middle - start) * 1000, digits, (end - middle_two) * 1000, exact))
+
+
+def benchmark_folding(sizes=(250, 500, 1000)):
+    """
+    Evaluates a sum of integers and a product of rationals with *size* numeric arguments and a symbol each. The
+    numbers are folded in a single pass, so the time should grow linearly with the size.
+    """
+    for size in sizes:
+        total = Function('Plus', Sequence([Integer(i * 7919 % 100003 + 2000) for i in range(size)] + [Symbol('x')]))
+        product = Function('Times', Sequence([Rational(Integer(i + 2), Integer(i + 1)) for i in range(size)] +
+                                             [Symbol('x')]))
+        start = perf_counter()
+        kernel.evaluate(total)
+        middle = perf_counter()
+        result = kernel.evaluate(product)
+        end = perf_counter()
+        print('folding:        %4d arguments, sum %.2f ms, product %.2f ms, product %s' % (
+            size, (middle - start) * 1000, (end - middle) * 1000, result))
+
+
+if __name__ == '__main__':
+    benchmark_dispatch()
+    benchmark_net()
+    benchmark_orderless()
+    benchmark_orderless_flat()
+    benchmark_fingerprints()
+    benchmark_garbage_collection()
+    benchmark_interning()
+    benchmark_canonical_order()
+    benchmark_cache()
+    benchmark_rule_attempts()
+    benchmark_deep()
+    benchmark_budget()
+    benchmark_tracing()
+    benchmark_profile()
+    benchmark_reordering()
+    benchmark_guards()
+    benchmark_free_symbols()
+    benchmark_templates()
+    benchmark_memory()
+    benchmark_substitute()
+    benchmark_rebuild()
+    benchmark_numbers()
+    benchmark_folding()
@@ -1,8 +1,17 @@
 """
 The evaluation module contains all classes used to evaluate expressions.
 """
+import json
+from collections import OrderedDict
+from enum import Enum
+from heapq import merge, heappush, heappop
+from os.path import basename
+from threading import Event, local
+from time import monotonic, perf_counter
 from printing import Printer
-from expressions import Function, Sequence, Symbol, Bindings
+from profiling import Profiler
+from expressions import Expression, Function, Sequence, Symbol, Integer, Real, Rational, Complex, Bindings, Attribute, \
+    BoundPattern, Blank, Pattern, Number, attribute_table
 
 
 class Kernel:
@@ -10,15 +19,38 @@ class Kernel:
     This class is provides the context for the evaluation of expressions. It manages the rule set, substitution
     environments and the the assigned attributes.
     """
+
+    # The steps of the evaluation stack: evaluate an expression, rebuild a function from its evaluated parts and
+    # store the value of an expression in the cache. Rebuild steps remember the height of the value stack.
+    _VISIT, _REBUILD, _STORE = range(3)
+
     def __init__(self, printer=None):
         if printer is None:
             printer = Printer()
         self.printer = printer
         self.rules = []
+        self._dispatch = {}
+        self._generic_rules = []
+        self._candidates = {}
+        # The position of every rule in the order the rules were first added, which reordering keeps.
+        self._insertion = {}
+        self.net = None
+        self.cache = None
+        self.tracer = None
+        self.profiler = None
+        self.predicates = {}
+        # The guards of every rule compiled against this kernel, see Rule.compile_guards.
+        self._checks = {}
+        self.folding = {}
+        self.attributes = attribute_table
+        self._stamp = object()
+        # The version of the attribute table the normal form marks and the cache were made under.
+        self._attributes_version = attribute_table.version
 
     def add_rule(self, rule):
         """
-        Add a rule to the kernel rule set.
+        Add a rule to the kernel rule set. The rule is filed in the dispatch table under the head and arity of its
+        pattern, so that evaluation only has to try rules that can possibly match a given expression.
 
         **Parameters:**
 
@@ -27,8 +59,416 @@ class Kernel:
         **Returns:**
 
             ``None``
+
+        **Raises:**
+
+            *RuntimeError* if the rule set is frozen.
         """
+        if self.net is not None:
+            raise RuntimeError('Cannot add a rule to a frozen rule set')
+        self.invalidate()
+        self._checks[rule] = rule.compile_guards(self)
+        self._insertion.setdefault(rule, len(self._insertion))
+        entry = (len(self.rules), rule)
         self.rules.append(rule)
+        key = Kernel._pattern_key(getattr(rule, 'pattern', None))
+        if key is None:
+            self._generic_rules.append(entry)
+        else:
+            self._dispatch.setdefault(key, []).append(entry)
+        self._candidates.clear()
+
+    def add_predicate(self, head, predicate):
+        """
+        Registers a Python function as the predicate with the given head. Guards of the form ``head[arguments]`` are
+        then checked by calling the function on the evaluated arguments instead of evaluating the whole guard. The
+        function has to agree with the rules for the head: it returns ``True`` exactly if the guard would evaluate to
+        ``True``. Results found with the guards as they were before are forgotten, see
+        :py:meth:`~evaluation.Kernel.invalidate`.
+
+        **Parameters:**
+
+            *head* - The head of the predicate, a :py:class:`~expressions.Symbol` or its name.
+
+            *predicate* - A function taking the arguments of the predicate and returning a boolean value.
+
+        **Returns:**
+
+            ``None``
+        """
+        if isinstance(head, str):
+            head = Symbol(head)
+        self.predicates[head] = predicate
+        for rule in self.rules:
+            self._checks[rule] = rule.compile_guards(self)
+        self.invalidate()
+
+    def add_folding(self, head, operation):
+        """
+        Registers a Python operation that folds the numeric arguments of functions with the given head in a single
+        pass, see :py:class:`~evaluation.FoldingRule`. Folding is tried before all other rules for the head, so that
+        a sum of many numbers is computed in one rewrite instead of one rewrite per number.
+
+        **Parameters:**
+
+            *head* - The head of the functions to fold, a :py:class:`~expressions.Symbol` or its name.
+
+            *operation* - A function combining two :py:class:`Numbers<expressions.Number>`, such as
+            ``operator.add``.
+
+        **Returns:**
+
+            ``None``
+        """
+        rule = FoldingRule(head, operation)
+        self.folding[rule.head] = rule
+        self._candidates.clear()
+        self.invalidate()
+
+    def set_attributes(self, symbol, attributes):
+        """
+        Replaces the attributes of a symbol in the :py:class:`~expressions.AttributeTable`. Functions are put into
+        normal form by the attributes of their head when they are constructed, so functions with the symbol as head
+        that already exist keep the form they have. The table is shared by all kernels, and each of them forgets its
+        earlier results before its next evaluation, see :py:meth:`~evaluation.Kernel.invalidate`.
+
+        **Parameters:**
+
+            *symbol* - The :py:class:`~expressions.Symbol` or its name.
+
+            *attributes* - The new attributes as an :py:class:`~expressions.Attribute` flag.
+
+        **Returns:**
+
+            ``None``
+        """
+        if isinstance(symbol, Symbol):
+            symbol = symbol.name
+        self.attributes.set(symbol, attributes)
+
+    def invalidate(self):
+        """
+        Forgets the results of earlier evaluations: the evaluation cache is emptied and all expressions marked as
+        being in normal form are evaluated again. The kernel does this itself whenever its rules or the attribute
+        table change, so that results found under the old ones aren't reused. Benchmarks call it to start every
+        evaluation from scratch.
+
+        **Returns:**
+
+            ``None``
+        """
+        if self.cache is not None:
+            self.cache.clear()
+        self._stamp = object()
+
+    @staticmethod
+    def _pattern_key(pattern):
+        # Rules whose pattern head is itself a pattern (e.g. f_[y_]) can match anything and go to the generic bucket.
+        if isinstance(pattern, Function):
+            if not isinstance(pattern.head, Expression) or not pattern.head.constant:
+                return None
+            if pattern.has_attribute(Attribute.Flat):
+                return pattern.head, None
+            return pattern.head, len(pattern.argument_sequence)
+        if isinstance(pattern, Expression):
+            return pattern.head,
+        return None
+
+    def freeze(self):
+        """
+        Freezes the rule set. All rule patterns are compiled into a single
+        :py:class:`~evaluation.DiscriminationNet` which replaces the dispatch table during evaluation. No rules can be
+        added until the kernel is thawed again.
+
+        **Returns:**
+
+            ``None``
+        """
+        self.net = DiscriminationNet(self.rules)
+
+    def thaw(self):
+        """
+        Unfreezes the rule set and goes back to the dispatch table, so that rules can be added again.
+
+        **Returns:**
+
+            ``None``
+        """
+        self.net = None
+
+    def enable_cache(self, max_entries=10000):
+        """
+        Turns on memoization of evaluation results. Every expression the kernel evaluates, including the
+        subexpressions and guards evaluated along the way, is stored with its normal form in an
+        :py:class:`~evaluation.EvaluationCache`. The cache is emptied whenever a rule is added.
+
+        **Parameters:**
+
+            *max_entries* - The number of expressions the cache holds before the least recently used ones are evicted.
+
+        **Returns:**
+
+            The cache.
+        """
+        self.cache = EvaluationCache(max_entries)
+        return self.cache
+
+    def disable_cache(self):
+        """
+        Turns off memoization of evaluation results and drops the cache.
+
+        **Returns:**
+
+            ``None``
+        """
+        self.cache = None
+
+    def enable_profiling(self):
+        """
+        Turns on profiling. From now on the kernel records how often every rule is tried, how often it matches and
+        rewrites and where the time is spent, see :py:class:`~profiling.Profiler`.
+
+        **Returns:**
+
+            The profiler.
+        """
+        self.profiler = Profiler()
+        return self.profiler
+
+    def disable_profiling(self):
+        """
+        Turns off profiling and drops the profiler.
+
+        **Returns:**
+
+            ``None``
+        """
+        self.profiler = None
+
+    def reorder_rules(self, profiler=None):
+        """
+        Reorders the rule set so that the rules that rewrote the most expressions are tried first. Only rules that
+        provably never match the same expression change places; every other pair of rules keeps its order, so the
+        results of evaluation do not change. Two rules are independent if their patterns differ in a constant head, a
+        constant atom, the head of a ``Blank`` or the number of arguments of a function that is neither ``Flat`` nor
+        ``Orderless``.
+
+        **Parameters:**
+
+            *profiler* - The :py:class:`~profiling.Profiler` with the statistics to use. Defaults to the profiler of
+            this kernel.
+
+        **Returns:**
+
+            ``None``
+
+        **Raises:**
+
+            *RuntimeError* if the rule set is frozen or if there are no statistics.
+        """
+        if profiler is None:
+            profiler = self.profiler
+        if profiler is None:
+            raise RuntimeError('Cannot reorder the rules without a profile')
+        hits = [profiler.profiles[rule].rewrites if rule in profiler.profiles else 0 for rule in self.rules]
+        predecessors = self._dependencies()
+        successors = [[] for _ in self.rules]
+        waiting = [len(indices) for indices in predecessors]
+        for i, indices in enumerate(predecessors):
+            for j in indices:
+                successors[j].append(i)
+        # Of all rules whose dependencies are placed, take the one with the most hits, then the oldest.
+        ready = []
+        for i, count in enumerate(waiting):
+            if count == 0:
+                heappush(ready, (-hits[i], i))
+        order = []
+        while ready:
+            _, i = heappop(ready)
+            order.append(self.rules[i])
+            for k in successors[i]:
+                waiting[k] -= 1
+                if waiting[k] == 0:
+                    heappush(ready, (-hits[k], k))
+        self._reindex(order)
+
+    def save_rule_order(self, path):
+        """
+        Saves the order of the rule set as a JSON list, so that a kernel with the same rules can start with this order,
+        see :py:meth:`~evaluation.Kernel.load_rule_order`. Every rule is saved as its position in the order the rules
+        were added together with its :py:meth:`~evaluation.Rule.description`, since different rules can have the same
+        string form.
+
+        **Parameters:**
+
+            *path* - The path of the file to write.
+
+        **Returns:**
+
+            ``None``
+
+        **Raises:**
+
+            *ValueError* if a rule was added more than once, so that its entries can't be told apart.
+        """
+        entries = [{'index': self._insertion[rule], 'rule': rule.description()} for rule in self.rules]
+        if len({entry['index'] for entry in entries}) != len(entries):
+            raise ValueError('Cannot save the order of a rule set that holds a rule more than once')
+        with open(path, 'w') as file:
+            json.dump(entries, file, indent=0)
+
+    def load_rule_order(self, path):
+        """
+        Reorders the rule set as saved by :py:meth:`~evaluation.Kernel.save_rule_order`. The rules are looked up by
+        the position they were added at and have to have the saved description.
+
+        **Parameters:**
+
+            *path* - The path of the file to read.
+
+        **Returns:**
+
+            ``None``
+
+        **Raises:**
+
+            *ValueError* if the saved order does not name the rules of this kernel or changes the order of two rules
+            that might match the same expression.
+
+            *RuntimeError* if the rule set is frozen.
+        """
+        with open(path) as file:
+            entries = json.load(file)
+        rules = {self._insertion[rule]: rule for rule in self.rules}
+        order = []
+        for entry in entries:
+            rule = rules.pop(entry['index'], None)
+            if rule is None or rule.description() != entry['rule']:
+                raise ValueError('The saved order names an unknown rule: ' + entry['rule'])
+            order.append(rule)
+        if len(order) != len(self.rules):
+            raise ValueError('The saved order does not name every rule')
+        positions = {rule: position for position, rule in enumerate(order)}
+        for i, indices in enumerate(self._dependencies()):
+            for j in indices:
+                if positions[self.rules[j]] > positions[self.rules[i]]:
+                    raise ValueError('The saved order swaps two rules that might match the same expression: ' +
+                                     self.rules[j].description() + ' and ' + self.rules[i].description())
+        self._reindex(order)
+
+    def _dependencies(self):
+        # For every rule the indices of the earlier rules that might match the same expressions. Rules filed under
+        # another head in the dispatch table are independent, so only rules with the same head and the generic rules
+        # are compared.
+        by_head = {}
+        generic = []
+        predecessors = []
+        for i, rule in enumerate(self.rules):
+            pattern = getattr(rule, 'pattern', None)
+            key = Kernel._pattern_key(pattern)
+            earlier = generic + by_head.get(key[0], []) if key is not None else range(i)
+            predecessors.append([j for j in earlier
+                                 if not Kernel._disjoint(getattr(self.rules[j], 'pattern', None), pattern)])
+            if key is None:
+                generic.append(i)
+            else:
+                by_head.setdefault(key[0], []).append(i)
+        return predecessors
+
+    @staticmethod
+    def _disjoint(first, second):
+        # Returns True if no expression can match both patterns. When in doubt the patterns are not disjoint.
+        pairs = [(first, second)]
+        while pairs:
+            first, second = pairs.pop()
+            if isinstance(first, BoundPattern):
+                first = first.base_pattern
+            if isinstance(second, BoundPattern):
+                second = second.base_pattern
+            if isinstance(first, Blank) or isinstance(second, Blank):
+                blank, other = (first, second) if isinstance(first, Blank) else (second, first)
+                if blank.head is None:
+                    continue
+                if isinstance(other, Blank):
+                    head = other.head
+                elif isinstance(other, Expression) and isinstance(other.head, Expression) and other.head.constant:
+                    head = other.head
+                else:
+                    continue
+                if head is not None and head != blank.head:
+                    return True
+                continue
+            if not isinstance(first, Expression) or not isinstance(second, Expression):
+                continue
+            if isinstance(first, Function) != isinstance(second, Function):
+                return True
+            if isinstance(first, Function):
+                pairs.append((first.head, second.head))
+                fixed = not any(function.has_attribute(attribute) for function in (first, second)
+                                for attribute in (Attribute.Flat, Attribute.Orderless))
+                flat = first.has_attribute(Attribute.Flat) or second.has_attribute(Attribute.Flat)
+                if not flat and len(first.argument_sequence) != len(second.argument_sequence):
+                    return True
+                if fixed:
+                    pairs.extend(zip(first.argument_sequence.expressions, second.argument_sequence.expressions))
+            elif first.constant and second.constant:
+                if first != second:
+                    return True
+            elif type(first) != type(second):
+                return True
+            elif isinstance(first, Rational):
+                pairs.append((first.numerator, second.numerator))
+                pairs.append((first.denominator, second.denominator))
+            elif isinstance(first, Complex):
+                pairs.append((first.real, second.real))
+                pairs.append((first.imaginary, second.imaginary))
+        return False
+
+    def _reindex(self, rules):
+        if self.net is not None:
+            raise RuntimeError('Cannot reorder a frozen rule set')
+        self.rules = []
+        self._dispatch = {}
+        self._generic_rules = []
+        for rule in rules:
+            self.add_rule(rule)
+
+    def candidate_rules(self, expression):
+        """
+        Returns the rules that might match the given expression, in the order they were added to the kernel. Rules
+        filed under another head or arity are skipped without trying to match them. If the rule set is frozen the
+        candidates are looked up in the discrimination net instead. The folding rule registered for the head of a
+        function comes first.
+
+        **Parameters:**
+
+            *expression* - The expression the rules are looked up for.
+
+        **Returns:**
+
+            A list of rules.
+        """
+        if self.net is not None:
+            candidates = self.net.candidates(expression)
+            if isinstance(expression, Function) and expression.head in self.folding:
+                return [self.folding[expression.head]] + candidates
+            return candidates
+        if isinstance(expression, Function):
+            key = expression.head, len(expression.argument_sequence)
+            buckets = (key, (expression.head, None))
+        else:
+            key = expression.head,
+            buckets = (key,)
+        try:
+            return self._candidates[key]
+        except KeyError:
+            pass
+        entries = [self._dispatch.get(bucket, []) for bucket in buckets]
+        candidates = [rule for _, rule in merge(self._generic_rules, *entries, key=lambda entry: entry[0])]
+        if isinstance(expression, Function) and expression.head in self.folding:
+            candidates.insert(0, self.folding[expression.head])
+        self._candidates[key] = candidates
+        return candidates
 
     def print(self, expression):
         """
@@ -44,49 +484,157 @@ class Kernel:
         """
         print(self.printer.to_string(expression))
 
-    def evaluate(self, expression):
+    def evaluate(self, expression, budget=None):
         """
-        Evaluate the expression using the kernel rules set. Evaluation works by repeatedly applying all rules until the
-        output no longer changes.
+        Evaluate the expression using the kernel rules set. Evaluation works bottom-up: the head and the arguments of a
+        function are evaluated first, then the rules are applied to the function itself. When a rule rewrites the
+        expression the result is evaluated again, but all parts of it that are already in normal form are skipped.
+        Every expression that no rule applies to is marked as being in normal form, so it is never visited again as
+        long as the rule set does not change. Rules only look at the expression they are applied to, so a marked
+        expression stays in normal form wherever a rewrite moves it.
+        Because the parts are evaluated first, rules that overlap can give other results than applying the rules to the
+        whole expression first would. The bundled rules give the same results either way. For example, ``Log[a_, a_]``
+        has its own rule that gives ``1``, since the quotient ``Log[1] / Log[1]`` would otherwise be simplified after
+        its parts have already become ``0``.
         Since rewriting system are turing complete it is impossible to know whether this will lead to an infinite loop.
-        So the system keeps track of the number of replacements that have been made and when this number exceeds some
-        threshold the kernel stops the evaluation and returns the expression it got.
+        A :py:class:`~evaluation.Budget` limits the number of rewrites, the size of the expression and the time spent.
+        When it runs out the evaluation stops and the partially evaluated expression is returned. The reason is left
+        in the status of the budget. Evaluations started while the expression is evaluated, such as the evaluations of
+        guards, use the same budget unless they are given their own.
+
+        The evaluation does not recurse. Pending work is kept on an explicit stack and evaluated parts on a stack of
+        values, so arbitrarily deep expressions are evaluated in time and memory linear in their size.
 
         **Parameters:**
 
             *expression* - The expression to evaluate.
 
+            *budget* - The budget the evaluation may spend or ``None`` to evaluate without limits.
+
         **Returns:**
 
             The evaluated expression.
         """
-        # FIXME: Somehow this function doesn't really do what it should. It calls itself more often than needed.
-        changed = True
-        old_expression = expression
+        outer = getattr(_running, 'budget', None)
+        if budget is None:
+            budget = outer
+            if budget is None:
+                return self._evaluate(expression, None)
+        if budget.status != EvaluationStatus.Complete:
+            return expression
+        size = budget.size
+        budget.start(expression)
+        _running.budget = budget
+        try:
+            return self._evaluate(expression, budget)
+        finally:
+            _running.budget = outer
+            if outer is budget:
+                # The nested evaluation tracked the size of its own expression, the outer one continues with its own.
+                budget.size = size
 
-        while changed:
-            changed = False
-            for rule in self.rules:
-                c, expression = rule.apply(expression)
-                changed = changed or c
+    def _evaluate(self, expression, budget):
+        if self._attributes_version != self.attributes.version:
+            # The attributes changed since the last evaluation, possibly through another kernel.
+            self.invalidate()
+            self._attributes_version = self.attributes.version
+        stamp = self._stamp
+        cache = self.cache
+        stopped = False
+        values = []
+        tracer = self.tracer
+        profiler = self.profiler
+        # The profile of the rule that made the last rewrite, which the rebuilding of the functions above it is
+        # attributed to.
+        rewriter = None
+        compiled = self._checks
+        stack = [(expression, Kernel._VISIT, 0)]
+        while stack:
+            node, step, _ = stack.pop()
+            if step == Kernel._STORE:
+                if not stopped:
+                    cache.put(node, values[-1])
+                continue
+            if step == Kernel._VISIT:
+                if getattr(node, '_normal_form', None) is stamp or stopped:
+                    values.append(node)
+                    continue
+                if cache is not None:
+                    value = cache.get(node)
+                    if value is not None:
+                        rewriter = None
+                        if budget is not None and not budget.replace(node, value):
+                            stopped = True
+                            value = node
+                        values.append(value)
+                        continue
+                    stack.append((node, Kernel._STORE, 0))
+                if isinstance(node, Function):
+                    # Rebuild the function once its head and arguments are evaluated.
+                    stack.append((node, Kernel._REBUILD, len(values)))
+                    arguments = node.argument_sequence.expressions
+                    stack.extend((argument, Kernel._VISIT, 0) for argument in reversed(arguments))
+                    stack.append((node.head, Kernel._VISIT, 0))
+                    continue
+                current = node
+            else:
+                parts = [node.head, *node.argument_sequence.expressions]
+                new_parts = values[len(values) - len(parts):]
+                del values[len(values) - len(parts):]
+                if all(new is old for new, old in zip(new_parts, parts)):
+                    current = node
+                else:
+                    if rewriter is None:
+                        current = Function._rebuild(node, new_parts)
+                    else:
+                        start = perf_counter()
+                        current = Function._rebuild(node, new_parts)
+                        rewriter.rebuild_time += perf_counter() - start
+                    if getattr(current, '_normal_form', None) is stamp:
+                        values.append(current)
+                        continue
+                if stopped:
+                    values.append(current)
+                    continue
+            if budget is not None and budget.expired():
+                # Unwind the stack without applying any more rules to assemble the partial result.
+                stopped = True
+                values.append(current)
+                continue
+            for rule in self.candidate_rules(current):
+                if profiler is None:
+                    changed, result = rule.apply(current, compiled.get(rule))
+                else:
+                    profile = profiler.profile(rule)
+                    changed, result = rule.apply_profiled(current, profile, compiled.get(rule))
+                if budget is not None and budget.status != EvaluationStatus.Complete:
+                    # An evaluation started by the rule, like that of a guard, used up the budget. The rule may have
+                    # decided on a partial result, so it isn't applied.
+                    stopped = True
+                    values.append(current)
+                    break
                 if changed:
-                    # print(rule)
-                    print(old_expression, '->', expression)
-                    # print()
+                    if budget is not None and not budget.rewrite(current, result):
+                        stopped = True
+                        values.append(current)
+                        break
+                    if tracer is not None:
+                        tracer.rewrite(rule, Kernel._position(stack, values), current, result)
+                    if profiler is not None:
+                        rewriter = profile
+                    stack.append((result, Kernel._VISIT, 0))
                     break
+            else:
+                current._normal_form = stamp
+                values.append(current)
+        return values[0]
 
-        # FIXME: This code is very slow. There has to be a better way!
-        if isinstance(expression, Function):
-            new_head = expression.head
-            new_head = self.evaluate(new_head)
-            new_arguments = []
-            for argument in expression.argument_sequence.expressions:
-                new_arguments.append(self.evaluate(argument))
-            expression = Function(new_head, Sequence(new_arguments))
-
-        if old_expression != expression:
-            return self.evaluate(expression)
-        return expression
+    @staticmethod
+    def _position(stack, values):
+        # The rebuild steps on the stack belong to the ancestors of the current expression. The number of values an
+        # ancestor has collected since its step was pushed is the index of the part that is being evaluated.
+        heights = [height for _, step, height in stack if step == Kernel._REBUILD] + [len(values)]
+        return [heights[i + 1] - heights[i] for i in range(len(heights) - 1)]
 
     def evaluate_and_print(self, expression):
         """
@@ -102,15 +650,433 @@ class Kernel:
         """
         self.print(self.evaluate(expression))
 
+
+class DiscriminationNet:
+    """
+    A DiscriminationNet merges the patterns of many rules into a single tree. Every pattern is read in preorder as a
+    string of tokens: function nodes with their arity, followed by the head and the arguments, and atoms such as
+    symbols and integers. Pattern variables become a wildcard that skips a whole subexpression. Patterns that share a
+    prefix share the path through the tree, so one walk over an expression finds every rule whose pattern could match
+    it, no matter how many rules there are.
+
+    The arguments of ``Orderless`` and ``Flat`` functions can be reordered and regrouped, so the net only looks at the
+    head of such a function and leaves its arguments to the matcher of the rule.
+    """
+
+    class Node:
+        """
+        A node of the net. It maps tokens to child nodes and stores the rules whose pattern ends here.
+        """
+
+        def __init__(self):
+            self.children = {}
+            self.wildcard = None
+            self.rules = []
+
+    def __init__(self, rules=None):
+        self.root = DiscriminationNet.Node()
+        self.size = 0
+        if rules is not None:
+            for rule in rules:
+                self.add_rule(rule)
+
+    def add_rule(self, rule):
+        """
+        Adds the pattern of a rule to the net. Rules keep the priority of the order they were added in.
+
+        **Parameters:**
+
+            *rule* - The rule to add.
+
+        **Returns:**
+
+            ``None``
+        """
+        node = self.root
+        for token in self._pattern_tokens(getattr(rule, 'pattern', None)):
+            if token is None:
+                if node.wildcard is None:
+                    node.wildcard = DiscriminationNet.Node()
+                node = node.wildcard
+            else:
+                node = node.children.setdefault(token, DiscriminationNet.Node())
+        node.rules.append((self.size, rule))
+        self.size += 1
+
+    @staticmethod
+    def _pattern_tokens(pattern):
+        # A token of None is the wildcard.
+        if isinstance(pattern, Function):
+            # Expressions are read by the attributes of their head. A pattern with attributes of its own would be
+            # filed where those expressions never arrive, so it becomes a wildcard and is left to the matcher.
+            order = int(Attribute.Orderless | Attribute.Flat)
+            head_attributes = pattern.head.attributes if isinstance(pattern.head, Symbol) else 0
+            if pattern.attributes & order != head_attributes & order:
+                return [None]
+            if pattern.has_attribute(Attribute.Orderless) or pattern.has_attribute(Attribute.Flat):
+                return [('Orderless', pattern.head)]
+            tokens = [('Function', len(pattern.argument_sequence))]
+            tokens += DiscriminationNet._pattern_tokens(pattern.head)
+            for argument in pattern.argument_sequence.expressions:
+                tokens += DiscriminationNet._pattern_tokens(argument)
+            return tokens
+        if isinstance(pattern, Rational):
+            return [('Rational',)] + DiscriminationNet._pattern_tokens(
+                pattern.numerator) + DiscriminationNet._pattern_tokens(pattern.denominator)
+        if isinstance(pattern, Complex):
+            return [('Complex',)] + DiscriminationNet._pattern_tokens(
+                pattern.real) + DiscriminationNet._pattern_tokens(pattern.imaginary)
+        if isinstance(pattern, (Symbol, Integer, Real)):
+            return [pattern]
+        return [None]
+
+    @staticmethod
+    def _expression_token(expression):
+        # Returns the token of the expression, the subexpressions that follow it and the token used by Orderless
+        # and Flat patterns.
+        if isinstance(expression, Function):
+            orderless_token = None
+            if expression.has_attribute(Attribute.Orderless) or expression.has_attribute(Attribute.Flat):
+                orderless_token = ('Orderless', expression.head)
+            return ('Function', len(expression.argument_sequence)), [
+                expression.head, *expression.argument_sequence.expressions], orderless_token
+        if isinstance(expression, Rational):
+            return ('Rational',), [expression.numerator, expression.denominator], None
+        if isinstance(expression, Complex):
+            return ('Complex',), [expression.real, expression.imaginary], None
+        if isinstance(expression, (Symbol, Integer, Real)):
+            return expression, [], None
+        return ('Opaque', id(expression)), [], None
+
+    def candidates(self, expression):
+        """
+        Walks the net along the given expression and returns every rule whose pattern could match it, in the order the
+        rules were added. The returned rules still have to be matched to find the bindings, but all other rules are
+        known not to match.
+
+        **Parameters:**
+
+            *expression* - The expression to look up.
+
+        **Returns:**
+
+            A list of rules.
+        """
+        found = []
+        # The expressions that still have to be read are kept as a linked list of (expression, rest) pairs.
+        stack = [(self.root, (expression, None))]
+        while stack:
+            node, pending = stack.pop()
+            if pending is None:
+                found += node.rules
+                continue
+            current, rest = pending
+            if node.wildcard is not None:
+                stack.append((node.wildcard, rest))
+            token, subexpressions, orderless_token = DiscriminationNet._expression_token(current)
+            if orderless_token is not None and orderless_token in node.children:
+                stack.append((node.children[orderless_token], rest))
+            if token in node.children:
+                for subexpression in reversed(subexpressions):
+                    rest = (subexpression, rest)
+                stack.append((node.children[token], rest))
+        found.sort(key=lambda entry: entry[0])
+        return [rule for _, rule in found]
+
+    def match(self, expression):
+        """
+        Returns every rule that matches the given expression together with the bindings of its first match.
+
+        **Parameters:**
+
+            *expression* - The expression to match.
+
+        **Returns:**
+
+            A list of (rule, bindings) tuples in the order the rules were added.
+        """
+        matches = []
+        for rule in self.candidates(expression):
+            for bindings in rule.pattern.match(expression, Bindings()):
+                matches.append((rule, bindings))
+                break
+        return matches
+
+
 kernel = Kernel()
 
 
+class FilterStatistics:
+    """
+    Counts how often rules compared the fingerprint of their pattern with the summary of an expression and how many
+    of those comparisons rejected the expression, saving a match attempt. Like the profiles of the rules, the counters
+    are only updated while the kernel is profiling, so that evaluation without a profiler doesn't pay for them.
+    """
+
+    def __init__(self):
+        self.checked = 0
+        self.rejected = 0
+
+    def reset(self):
+        """
+        Sets all counters back to zero.
+
+        **Returns:**
+
+            ``None``
+        """
+        self.checked = 0
+        self.rejected = 0
+
+    def __str__(self):
+        return 'checked ' + str(self.checked) + ', rejected ' + str(self.rejected)
+
+
+filter_statistics = FilterStatistics()
+
+
+class EvaluationCache:
+    """
+    Maps expressions to their normal forms under the rule set of a kernel. Expressions are interned, so equal
+    expressions are the same object and hash by identity. A lookup is a dictionary lookup by identity: it never
+    compares whole trees and two different expressions can't share an entry. The cache holds at most *max_entries*
+    expressions and evicts the least recently used entry when it is full. The entries keep their expressions alive.
+    """
+
+    def __init__(self, max_entries=10000):
+        if max_entries < 1:
+            raise ValueError('The cache must hold at least one entry')
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, expression):
+        """
+        Looks up the normal form of an expression and marks the entry as recently used.
+
+        **Parameters:**
+
+            *expression* - The expression to look up.
+
+        **Returns:**
+
+            The normal form of the expression or ``None`` if it is not in the cache.
+        """
+        try:
+            result = self.entries[expression]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(expression)
+        self.hits += 1
+        return result
+
+    def put(self, expression, result):
+        """
+        Stores the normal form of an expression, evicting the least recently used entry if the cache is full.
+
+        **Parameters:**
+
+            *expression* - The evaluated expression.
+
+            *result* - Its normal form.
+
+        **Returns:**
+
+            ``None``
+        """
+        self.entries[expression] = result
+        self.entries.move_to_end(expression)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Removes all entries. The statistics are kept.
+
+        **Returns:**
+
+            ``None``
+        """
+        self.entries.clear()
+
+    def reset(self):
+        """
+        Sets all counters back to zero.
+
+        **Returns:**
+
+            ``None``
+        """
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __str__(self):
+        return 'entries ' + str(len(self.entries)) + ', hits ' + str(self.hits) + ', misses ' + str(self.misses) + \
+            ', evictions ' + str(self.evictions)
+
+
+# The budget of the evaluation running on each thread, which the evaluations it starts itself share.
+_running = local()
+
+
+class EvaluationStatus(Enum):
+    """
+    The outcome of an evaluation with a :py:class:`~evaluation.Budget`.
+    """
+    Complete = 0
+    RewriteLimit = 1
+    SizeLimit = 2
+    Deadline = 3
+    Cancelled = 4
+
+
+class CancellationToken:
+    """
+    A flag another thread can set to stop the evaluations whose budget holds this token. The evaluation notices the
+    cancellation before it tries the rules on the next expression.
+    """
+
+    def __init__(self):
+        self._event = Event()
+
+    def cancel(self):
+        """
+        Requests the cancellation of all evaluations using this token.
+
+        **Returns:**
+
+            ``None``
+        """
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+
+class Budget:
+    """
+    Limits the work done by :py:meth:`Kernel.evaluate<evaluation.Kernel.evaluate>`. A budget can be shared by several
+    evaluations, for example all evaluations of one request, and an evaluation with a budget that has already run out
+    returns its expression unchanged. Evaluations started by an evaluation, such as the evaluations of guards, share
+    its deadline, token and count of rewrites, while the size limit applies to each expression separately. Every limit
+    is optional.
+
+    **Parameters:**
+
+        *max_rewrites* - The number of rule applications allowed.
+
+        *max_size* - The number of nodes the evaluated expression may grow to. Rewrites that would make it larger are
+        not performed.
+
+        *timeout* - The number of seconds from the creation of the budget after which evaluation stops.
+
+        *token* - A :py:class:`~evaluation.CancellationToken` that stops evaluation when it is cancelled.
+    """
+
+    def __init__(self, max_rewrites=None, max_size=None, timeout=None, token=None):
+        self.max_rewrites = max_rewrites
+        self.max_size = max_size
+        self.deadline = None if timeout is None else monotonic() + timeout
+        self.token = token
+        self.rewrites = 0
+        self.size = 0
+        self.status = EvaluationStatus.Complete
+
+    def start(self, expression):
+        """
+        Starts tracking the size of an expression about to be evaluated.
+
+        **Parameters:**
+
+            *expression* - The expression to evaluate.
+
+        **Returns:**
+
+            ``None``
+        """
+        if self.max_size is not None:
+            self.size = expression.size()
+
+    def expired(self):
+        """
+        Checks the deadline and the cancellation token.
+
+        **Returns:**
+
+            ``True`` if the evaluation has to stop. The status says why.
+        """
+        if self.token is not None and self.token.cancelled:
+            self.status = EvaluationStatus.Cancelled
+        elif self.deadline is not None and monotonic() > self.deadline:
+            self.status = EvaluationStatus.Deadline
+        else:
+            return False
+        return True
+
+    def rewrite(self, expression, result):
+        """
+        Accounts for a rule rewriting a part of the evaluated expression.
+
+        **Parameters:**
+
+            *expression* - The rewritten expression.
+
+            *result* - The result of the rule.
+
+        **Returns:**
+
+            ``True`` if the budget allows the rewrite, ``False`` if the evaluation has to stop instead.
+        """
+        if self.max_rewrites is not None and self.rewrites >= self.max_rewrites:
+            self.status = EvaluationStatus.RewriteLimit
+            return False
+        if not self.replace(expression, result):
+            return False
+        self.rewrites += 1
+        return True
+
+    def replace(self, expression, result):
+        """
+        Accounts for replacing a part of the evaluated expression by another expression, either by a rule or by its
+        value from the evaluation cache.
+
+        **Parameters:**
+
+            *expression* - The replaced expression.
+
+            *result* - The expression replacing it.
+
+        **Returns:**
+
+            ``True`` if the budget allows the replacement, ``False`` if the evaluation has to stop instead.
+        """
+        if self.max_size is not None:
+            growth = result.size() - expression.size()
+            if growth > 0 and self.size + growth > self.max_size:
+                self.status = EvaluationStatus.SizeLimit
+                return False
+            self.size += growth
+        return True
+
+    def __str__(self):
+        return self.status.name + ' after ' + str(self.rewrites) + ' rewrites'
+
+
 class Rule:
     """
     Base class for all rules.
     """
 
-    def apply(self, expression):
+    def apply(self, expression, checks=None):
         """
         Applies this rule to the given expression. This method should be overwritten by anyone subclassing this class.
 
@@ -118,18 +1084,259 @@ class Rule:
 
             *expression* - The expression the rule is applied to.
 
+            *checks* - The guards of the rule as compiled by :py:meth:`~evaluation.Rule.compile_guards` for the
+            kernel that applies the rule. ``None`` uses the checks compiled for the default kernel.
+
         **Returns:**
 
             ``None``
         """
         pass
 
+    def description(self):
+        """
+        Returns a string that tells this rule apart from other rules better than its string form, which leaves out the
+        heads of blanks and the guards. Subclasses overwrite this method, the default is the string form.
+
+        **Returns:**
+
+            The description.
+        """
+        return str(self)
+
+    @staticmethod
+    def _full_form(expression):
+        # Like the string form, but blanks show their head.
+        if isinstance(expression, BoundPattern):
+            return 'BoundPattern[' + expression.name + ', ' + Rule._full_form(expression.base_pattern) + ']'
+        if isinstance(expression, Blank):
+            return 'Blank[' + ('' if expression.head is None else str(expression.head)) + ']'
+        if isinstance(expression, Function):
+            return Rule._full_form(expression.head) + '[' + ', '.join(
+                Rule._full_form(argument) for argument in expression.argument_sequence.expressions) + ']'
+        if isinstance(expression, Rational):
+            return 'Rational[' + Rule._full_form(expression.numerator) + ', ' + \
+                Rule._full_form(expression.denominator) + ']'
+        if isinstance(expression, Complex):
+            return 'Complex[' + Rule._full_form(expression.real) + ', ' + Rule._full_form(expression.imaginary) + ']'
+        if callable(expression) and not isinstance(expression, Pattern):
+            # Python code is named by where it is defined.
+            code = getattr(expression, '__code__', None)
+            name = getattr(expression, '__qualname__', repr(expression))
+            if code is None:
+                return name
+            return name + ' at ' + basename(code.co_filename) + ':' + str(code.co_firstlineno)
+        return str(expression)
+
+    def _guards_description(self):
+        return ''.join(' /; ' + Rule._full_form(guard) for guard in getattr(self, 'guards', []))
+
+    def compile_guards(self, evaluating_kernel):
+        """
+        Turns the guards of this rule into a list of checks, functions taking the bindings of a match and returning
+        whether the guard holds. Guards that are Python functions are called with the bindings. Guards whose head is a
+        predicate registered with the kernel call the predicate with their evaluated arguments. All other guards are
+        evaluated and hold if they evaluate to ``True``. The rule itself is not changed, so it can be part of several
+        kernels: every kernel keeps the checks it compiled and passes them to :py:meth:`~evaluation.Rule.apply`.
+
+        **Parameters:**
+
+            *evaluating_kernel* - The kernel the rule is added to, which evaluates the guards. ``None`` evaluates them
+            with the default kernel.
+
+        **Returns:**
+
+            The list of checks.
+        """
+        variables = Rule._variables(getattr(self, 'pattern', None))
+        return [Rule._compile_guard(guard, evaluating_kernel, variables) for guard in getattr(self, 'guards', [])]
+
+    @staticmethod
+    def _compile_guard(guard, evaluating_kernel, variables):
+        if callable(guard) and not isinstance(guard, Pattern):
+            return guard
+        true = Symbol('True')
+        if evaluating_kernel is None:
+            # The default checks of the rule. Every kernel the rule is added to compiles its own.
+            evaluating_kernel = kernel
+        if isinstance(guard, Function) and guard.head in evaluating_kernel.predicates:
+            predicate = evaluating_kernel.predicates[guard.head]
+            builders = [Rule._compile_template(argument, variables) for argument in guard.argument_sequence.expressions]
+
+            def check(bindings):
+                return predicate(*[evaluating_kernel.evaluate(build(bindings)) for build in builders])
+            return check
+        build = Rule._compile_template(guard, variables)
+
+        def check(bindings):
+            return evaluating_kernel.evaluate(build(bindings)) == true
+        return check
+
+    @staticmethod
+    def _variables(pattern):
+        # Returns the names of all pattern variables in a pattern.
+        names = set()
+        stack = [pattern]
+        while stack:
+            part = stack.pop()
+            if isinstance(part, BoundPattern):
+                names.add(part.name)
+                stack.append(part.base_pattern)
+            elif isinstance(part, Function):
+                stack.append(part.head)
+                stack.extend(part.argument_sequence.expressions)
+            elif isinstance(part, Sequence):
+                stack.extend(part.expressions)
+            elif isinstance(part, Rational):
+                stack.extend((part.numerator, part.denominator))
+            elif isinstance(part, Complex):
+                stack.extend((part.real, part.imaginary))
+        return frozenset(names)
+
+    @staticmethod
+    def _compile_template(template, variables):
+        """
+        Compiles a template into a builder, a function taking the bindings of a match and returning the template with
+        the bindings substituted, like ``template.substitute(bindings)`` does. Symbols named like a pattern variable are
+        the holes of the template. Parts without holes are returned as they are instead of being rebuilt, so only the
+        functions on the paths to the holes are constructed when the builder runs. Which arguments have holes and the
+        heads without holes are found when the template is compiled, and functions whose head is neither ``Flat`` nor
+        ``Orderless`` are constructed without normalizing their arguments.
+
+        **Parameters:**
+
+            *template* - The expression to compile.
+
+            *variables* - The names of the pattern variables.
+
+        **Returns:**
+
+            The builder.
+        """
+        if isinstance(template, Symbol) and template.name in variables:
+            name = template.name
+
+            def build(bindings):
+                try:
+                    return bindings[name]
+                except KeyError:
+                    return template
+            return build
+        if isinstance(template, (Function, Sequence)) and \
+                any(symbol.name in variables for symbol in template.free_symbols()):
+            arguments = template.expressions if isinstance(template, Sequence) else \
+                template.argument_sequence.expressions
+            # Only the arguments with holes are built, the others are copied from the template.
+            holes = [(i, Rule._compile_template(argument, variables)) for i, argument in enumerate(arguments)
+                     if any(symbol.name in variables for symbol in argument.free_symbols())]
+            if isinstance(template, Sequence):
+                def build(bindings):
+                    parts = list(arguments)
+                    for i, build_part in holes:
+                        parts[i] = build_part(bindings)
+                    return Sequence(parts)
+                return build
+            head = template.head
+            if any(symbol.name in variables for symbol in head.free_symbols()):
+                build_head = Rule._compile_template(head, variables)
+
+                def build(bindings):
+                    parts = list(arguments)
+                    for i, build_part in holes:
+                        parts[i] = build_part(bindings)
+                    return Function(build_head(bindings), Sequence(parts))
+                return build
+            normalizing = int(Attribute.Flat | Attribute.Orderless)
+            if template.attributes & normalizing:
+                # Only the built arguments can break the normal form, which Function._rebuild checks.
+                def build(bindings):
+                    parts = [head, *arguments]
+                    for i, build_part in holes:
+                        parts[i + 1] = build_part(bindings)
+                    return Function._rebuild(template, parts)
+                return build
+
+            # Functions whose head is neither Flat nor Orderless are in normal form whatever is bound to the holes,
+            # unless the head was given one of these attributes after the rule was compiled.
+            symbol_head = isinstance(head, Symbol)
+
+            def build(bindings):
+                parts = list(arguments)
+                for i, build_part in holes:
+                    parts[i] = build_part(bindings)
+                return Function(head, Sequence(parts), canonical=not symbol_head or not head.attributes & normalizing)
+            return build
+
+        def build(bindings):
+            return template
+        return build
+
+    def apply_profiled(self, expression, profile, checks=None):
+        """
+        Applies this rule like :py:meth:`~evaluation.Rule.apply` and records the work done in a profile. Subclasses
+        may overwrite this method to break the time down into phases, otherwise all of it counts as matching.
+
+        **Parameters:**
+
+            *expression* - The expression the rule is applied to.
+
+            *profile* - The :py:class:`~profiling.RuleProfile` of this rule.
+
+            *checks* - The compiled guards, as for :py:meth:`~evaluation.Rule.apply`.
+
+        **Returns:**
+
+            The same as :py:meth:`~evaluation.Rule.apply`.
+        """
+        profile.attempts += 1
+        start = perf_counter()
+        changed, result = self.apply(expression, checks)
+        profile.match_time += perf_counter() - start
+        if changed:
+            profile.matches += 1
+            profile.rewrites += 1
+        return changed, result
+
+    def _profiled_matches(self, expression, profile):
+        # Yields the matches of the pattern like apply does, counting them and timing the matcher between them.
+        filter_statistics.checked += 1
+        start = perf_counter()
+        if not self.fingerprint.admits(expression.summary()):
+            filter_statistics.rejected += 1
+            profile.match_time += perf_counter() - start
+            return
+        matches = self.pattern.match(expression, Bindings())
+        while True:
+            bindings = next(matches, None)
+            profile.match_time += perf_counter() - start
+            if bindings is None:
+                return
+            profile.matches += 1
+            yield bindings
+            start = perf_counter()
+
+    def _profiled_guards(self, bindings, profile, checks):
+        # Evaluates the guards until one fails, counting and timing the evaluations.
+        start = perf_counter()
+        try:
+            for check in checks:
+                profile.guard_evaluations += 1
+                if not check(bindings):
+                    profile.guard_failures += 1
+                    return False
+            return True
+        finally:
+            profile.guard_time += perf_counter() - start
+
 
 class SubstitutionRule(Rule):
     """
     A SubstitutionRule consists of a pattern, a substitution expression and zero or more guards. When applied it will
     check whether the given expression matches its pattern and substitute the matching expressions by the substitution
     expression.
+
+    A guard is either an expression that has to evaluate to ``True`` or a Python function that is called with the
+    bindings of the match and returns a boolean value, see :py:meth:`~evaluation.Rule.compile_guards`.
     """
 
     def __init__(self, pattern, substitution, guards=None):
@@ -137,30 +1344,92 @@ class SubstitutionRule(Rule):
             guards = []
         self.guards = guards
         self.pattern = pattern
+        self.fingerprint = pattern.fingerprint()
         self.substitution = substitution
         self.guards = guards
+        self.build = Rule._compile_template(substitution, Rule._variables(pattern))
+        self.checks = self.compile_guards(None)
 
-    def apply(self, expression):
-        bindings = Bindings()
-        for match in self.pattern.match(expression, bindings):
-            bindings = match.bindings
-            for guard in self.guards:
-                if not kernel.evaluate(guard.substitute(bindings)) == Symbol('True'):
+    def apply(self, expression, checks=None):
+        if checks is None:
+            checks = self.checks
+        if not self.fingerprint.admits(expression.summary()):
+            return False, expression
+        for bindings in self.pattern.match(expression, Bindings()):
+            for check in checks:
+                if not check(bindings):
                     return False, expression
-            return True, self.substitution.substitute(bindings)
+            return True, self.build(bindings)
+        return False, expression
+
+    def apply_profiled(self, expression, profile, checks=None):
+        if checks is None:
+            checks = self.checks
+        profile.attempts += 1
+        for bindings in self._profiled_matches(expression, profile):
+            if not self._profiled_guards(bindings, profile, checks):
+                return False, expression
+            start = perf_counter()
+            result = self.build(bindings)
+            profile.substitute_time += perf_counter() - start
+            profile.rewrites += 1
+            return True, result
         return False, expression
 
+    def description(self):
+        return Rule._full_form(self.pattern) + ' -> ' + Rule._full_form(self.substitution) + self._guards_description()
+
     def __str__(self):
         return str(self.pattern) + ' -> ' + str(self.substitution)
 
 
+class FoldingRule(Rule):
+    """
+    A FoldingRule combines all numeric arguments of a function in a single pass, e.g. ``Plus[1, 2, 3, 4, a]`` to
+    ``Plus[10, a]``. In canonical order the numbers are the first arguments of ``Orderless`` functions, so they are
+    folded from left to right with the operation of the rule, which coerces them to the widest type as the arithmetic
+    of :py:class:`~expressions.Number` does. If all arguments are numbers the result is the folded number itself.
+
+    Folding rules are registered with :py:meth:`Kernel.add_folding<evaluation.Kernel.add_folding>` and applied to
+    functions with their head only. The operation has to be associative and commutative.
+    """
+
+    def __init__(self, head, operation):
+        if isinstance(head, str):
+            head = Symbol(head)
+        self.head = head
+        self.operation = operation
+        self.checks = []
+
+    def apply(self, expression, checks=None):
+        arguments = expression.argument_sequence.expressions
+        count = 0
+        for argument in arguments:
+            # Rationals that aren't exact numbers, like a rational with a zero denominator, end the numbers.
+            if not isinstance(argument, Number) or isinstance(argument, Rational) and argument._exact() is None:
+                break
+            count += 1
+        if count < 2:
+            return False, expression
+        value = arguments[0]
+        for i in range(1, count):
+            value = self.operation(value, arguments[i])
+        if count == len(arguments):
+            return True, value
+        # The folded number sorts before the remaining arguments, none of which is a number.
+        return True, Function(expression.head, Sequence((value,) + arguments[count:]), canonical=True)
+
+    def __str__(self):
+        return 'Fold[' + str(self.head) + ', ' + getattr(self.operation, '__name__', str(self.operation)) + ']'
+
+
 class LambdaRule(Rule):
     """
     A LambdaRule consists of a pattern, a lambda function and zero or more guards. When applied it will
     check whether the given expression matches its pattern and call the lambda function on the matching expressions.
 
     This rule is often used for addition and multiplication of integers which is hard to expression only using
-    :py:class:`~evaluation.SubstitutionRule`.
+    :py:class:`~evaluation.SubstitutionRule`. Guards are the same as for :py:class:`~evaluation.SubstitutionRule`.
     """
 
     def __init__(self, pattern, code, guards=None):
@@ -168,16 +1437,38 @@ class LambdaRule(Rule):
             guards = []
         self.guards = guards
         self.pattern = pattern
+        self.fingerprint = pattern.fingerprint()
         self.code = code
+        self.checks = self.compile_guards(None)
 
-    def apply(self, expression):
-        bindings = Bindings()
-        for match in self.pattern.match(expression, bindings):
-            bindings = match.bindings
-            guards_satisfied = True
-            for guard in self.guards:
-                if not kernel.evaluate(guard.substitute(bindings)) == Symbol('True'):
-                    guards_satisfied = False
-            if guards_satisfied:
+    def apply(self, expression, checks=None):
+        if checks is None:
+            checks = self.checks
+        if not self.fingerprint.admits(expression.summary()):
+            return False, expression
+        for bindings in self.pattern.match(expression, Bindings()):
+            if all(check(bindings) for check in checks):
                 return True, self.code(bindings).substitute(bindings)
         return False, expression
+
+    def apply_profiled(self, expression, profile, checks=None):
+        if checks is None:
+            checks = self.checks
+        profile.attempts += 1
+        for bindings in self._profiled_matches(expression, profile):
+            if self._profiled_guards(bindings, profile, checks):
+                start = perf_counter()
+                built = self.code(bindings)
+                middle = perf_counter()
+                result = built.substitute(bindings)
+                profile.build_time += middle - start
+                profile.substitute_time += perf_counter() - middle
+                profile.rewrites += 1
+                return True, result
+        return False, expression
+
+    def description(self):
+        return Rule._full_form(self.pattern) + ' -> ' + Rule._full_form(self.code) + self._guards_description()
+
+    def __str__(self):
+        return str(self.pattern) + ' -> ' + self.code.__name__
@@ -1,17 +1,139 @@
 """
 The classes in this module are used to represent mathematical expressions.
 """
-from enum import Enum
+from enum import IntFlag
+from fractions import Fraction
+from math import copysign, gcd
+from weakref import WeakValueDictionary
+from threading import Lock
 from collections.abc import Iterator, Iterable
-from itertools import permutations
+
+# Exact arithmetic on numbers uses the integers of gmpy2 if it is installed.
+try:
+    from gmpy2 import mpz as _integer, gcd as _gcd
+except ImportError:
+    _integer = int
+    _gcd = gcd
 
 
 class Pattern:
+    """
+    Base class for everything that can be matched against an expression. Matching is lazy: :py:meth:`match` returns a
+    generator over the bindings of all matches, so callers that only need the first match never compute the others.
+    Patterns that can match an expression in at most one way set *single* and implement :py:meth:`single_match`, which
+    matchers call directly instead of creating a generator.
+    """
+
+    __slots__ = ('constant', '_fingerprint')
+
+    single = False
+
     def __init__(self, constant):
         self.constant = constant
 
     def match(self, expression, bindings):
-        pass
+        """
+        Matches this pattern against the given expression. By default the single match found by
+        :py:meth:`single_match` is yielded, so subclasses overwrite either this method or :py:meth:`single_match`.
+
+        **Parameters:**
+
+            *expression* - The expression to match.
+
+            *bindings* - The :py:class:`~expressions.Bindings` of the surrounding match.
+
+        **Returns:**
+
+            An iterator over the bindings of all matches.
+        """
+        bindings = self.single_match(expression, bindings)
+        if bindings is not None:
+            yield bindings
+
+    def single_match(self, expression, bindings):
+        """
+        Matches this pattern against the given expression if it can match in at most one way. By default the first
+        match yielded by :py:meth:`match` is returned.
+
+        **Parameters:**
+
+            *expression* - The expression to match.
+
+            *bindings* - The :py:class:`~expressions.Bindings` of the surrounding match.
+
+        **Returns:**
+
+            The bindings of the match or ``None`` if there is no match.
+        """
+        return next(self.match(expression, bindings), None)
+
+    def fingerprint(self):
+        """
+        Returns the :py:class:`~expressions.Fingerprint` every expression matching this pattern has. It is computed
+        once and cached.
+        """
+        try:
+            return self._fingerprint
+        except AttributeError:
+            self._fingerprint = self._compute_fingerprint()
+            return self._fingerprint
+
+    def _compute_fingerprint(self):
+        return Fingerprint()
+
+    def sort_key(self):
+        """
+        Returns the key :py:class:`~expressions.Sequence` sorts arguments of ``Orderless`` functions by. Patterns
+        are sorted after all expressions.
+        """
+        return tuple(self._sort_parts())
+
+    def _sort_parts(self):
+        return [5, str(self)]
+
+
+class Fingerprint:
+    """
+    A Fingerprint describes the cheap properties of an expression: its head, its number of arguments and the tokens of
+    its arguments. The tokens of an argument are its head and, for symbols and numbers, the argument itself.
+
+    Patterns have a fingerprint listing what every matching expression must have, leaving out what they don't care
+    about. Expressions cache a fingerprint summarising themselves. Comparing the two rejects most expressions that can't
+    match a pattern before any matching is done.
+    """
+
+    def __init__(self, head=None, length=None, arguments=frozenset()):
+        self.head = head
+        self.length = length
+        self.arguments = arguments
+
+    @staticmethod
+    def tokens(expression):
+        """
+        Returns the tokens of an argument.
+        """
+        if isinstance(expression, (Symbol, Integer, Real)):
+            return expression.head, expression
+        return expression.head,
+
+    def admits(self, summary):
+        """
+        Returns whether an expression with the given summary could match a pattern with this fingerprint.
+
+        **Parameters:**
+
+            *summary* - The fingerprint of the expression as returned by :py:meth:`~expressions.Expression.summary`.
+
+        **Returns:**
+
+            ``False`` if the expression can't match. ``True`` otherwise.
+        """
+        return (self.head is None or self.head == summary.head) and (
+            self.length is None or self.length == summary.length) and self.arguments <= summary.arguments
+
+    def __str__(self):
+        return 'Fingerprint[' + str(self.head) + ', ' + str(self.length) + ', {' + ', '.join(
+            map(str, self.arguments)) + '}]'
 
 
 class BoundPattern(Pattern):
@@ -20,24 +142,25 @@ class BoundPattern(Pattern):
     If it is matched a second time it will look if it is bound to the same expression it tries to match.
     """
 
+    single = True
+
     def __init__(self, name, base_pattern):
         super().__init__(False)
         self.name = name
         self.base_pattern = base_pattern
 
-    def match(self, expression, bindings):
-        if self.base_pattern.match(expression, bindings):
-            if self.name in bindings:
-                if bindings[self.name] == expression:
-                    return SequenceMatchIterator([Match(bindings)])
-                else:
-                    return SequenceMatchIterator([])
-            else:
-                b = bindings
-                b.bind(self.name, expression)
-                return SequenceMatchIterator([Match(b)])
-        else:
-            return SequenceMatchIterator([])
+    def _compute_fingerprint(self):
+        return self.base_pattern.fingerprint()
+
+    def single_match(self, expression, bindings):
+        if isinstance(self.base_pattern, Blank):
+            if not self.base_pattern.matches(expression):
+                return None
+        elif next(self.base_pattern.match(expression, bindings), None) is None:
+            return None
+        if self.name in bindings:
+            return bindings if bindings[self.name] == expression else None
+        return bindings.bind(self.name, expression)
 
     def __str__(self):
         return 'BoundPattern[' + self.name + ']'
@@ -48,25 +171,34 @@ class Blank(Pattern):
     The Blank class will match any expression with the same head. If no head is passed in it will match any expression.
     """
 
+    single = True
+
     def __init__(self, head=None):
         super().__init__(False)
         self.head = head
 
-    def match(self, expression, bindings):
-        if self.head is None or self.head == expression.head:
-            return SequenceMatchIterator([Match(bindings)])
-        else:
-            return SequenceMatchIterator([])
+    def matches(self, expression):
+        """
+        Returns whether this Blank matches the given expression.
+        """
+        return self.head is None or self.head == expression.head
+
+    def single_match(self, expression, bindings):
+        return bindings if self.head is None or self.head == expression.head else None
+
+    def _compute_fingerprint(self):
+        return Fingerprint(self.head)
 
     def __str__(self):
         return 'Blank'
 
 
-class Attribute(Enum):
+class Attribute(IntFlag):
     """
-    Attributes define properties of expressions used in evaluation.
+    Attributes define properties of expressions used in evaluation. They are flags: the attributes of an expression
+    are stored as an integer with one bit set for every attribute it has.
     """
-    Orderless = 0
+    Orderless = 1
     """
     ``Orderless`` is an attribute assigned to functions to indicate that their arguments can be reordered arbitrarily.
     Usually the arguments will be sorted into a canonical form (similar to the way a human would sort them).
@@ -78,7 +210,7 @@ class Attribute(Enum):
 
         ``Power[x, 2]`` however will not be reordered.
     """
-    Flat = 1
+    Flat = 2
     """
     ``Flat`` is an attribute assigned to functions to indicate that nested function calls can be flattened.
     ``Flat`` corresponds to the mathematical notion of associativity.
@@ -89,7 +221,7 @@ class Attribute(Enum):
 
         ``Power[a, Power[b, c]]`` will not be flattened.
     """
-    OneIdentity = 2
+    OneIdentity = 4
     """
     ``OneIdentity`` is an attribute assigned to functions to indicate that function calls with a single argument can be
     replaced by their argument.
@@ -100,7 +232,7 @@ class Attribute(Enum):
 
         ``Sin[x]`` will not be replaced.
     """
-    Numeric = 3
+    Numeric = 8
     """
     ``Numeric`` is an attribute assigned to symbols to indicate that they represent numerical values. Symbols that
     have some numerical value (even if it is unknown) behave quite differently from symbols that don't have a numerical
@@ -118,7 +250,7 @@ class Attribute(Enum):
 
             While :math:`\infty` - :math:`\infty` will not be evaluated.
     """
-    Constant = 4
+    Constant = 16
     """
     ``Constant`` is an attribute assigned to symbols to indicate that they are mathematical constants.
     This attribute is used in differentiation.
@@ -127,7 +259,7 @@ class Attribute(Enum):
 
         :math:`\pi` and :math:`e` have the attribute ``Constant`` while ``x`` doesn't.
     """
-    NumericFunction = 5
+    NumericFunction = 32
     """
     ``NumericFunction`` is an attribute assigned to functions to indicate that they can be evaluated numerically given
     that all of their arguments can be evaluated numerically.
@@ -140,7 +272,7 @@ class Attribute(Enum):
 
         ``Cos[3.0]`` will not be evaluated.
     """
-    Hold = 6
+    Hold = 64
     """
     ``Hold`` is an attribute assigned to functions to indicate that their arguments should not be evaluated.
 
@@ -152,40 +284,166 @@ class Attribute(Enum):
 
         ``g[Plus[2, 2]]`` will yield ``g[4]``.
     """
-    Protected = 7
+    Protected = 128
     """
     ``Protected`` is an attribute assigned to functions to indicate that they cannot be redefined.
     """
 
 
-default_attributes = dict(Times=[Attribute.Flat, Attribute.Orderless, Attribute.OneIdentity],
-                          Plus=[Attribute.Flat, Attribute.Orderless, Attribute.OneIdentity],
-                          And=[Attribute.Flat, Attribute.Orderless, Attribute.OneIdentity],
-                          Or=[Attribute.Flat, Attribute.Orderless, Attribute.OneIdentity],
-                          Pi=[Attribute.Constant], E=[Attribute.Constant])
+default_attributes = dict(Times=Attribute.Flat | Attribute.Orderless | Attribute.OneIdentity,
+                          Plus=Attribute.Flat | Attribute.Orderless | Attribute.OneIdentity,
+                          And=Attribute.Flat | Attribute.Orderless | Attribute.OneIdentity,
+                          Or=Attribute.Flat | Attribute.Orderless | Attribute.OneIdentity,
+                          Pi=Attribute.Constant, E=Attribute.Constant)
+
+# The bits of the attributes checked while constructing and matching functions, as plain integers. Operators on
+# Attribute members run Python code, operators on integers don't.
+_ORDERLESS = int(Attribute.Orderless)
+_FLAT = int(Attribute.Flat)
+_NUMERIC = int(Attribute.Numeric)
+_CONSTANT = int(Attribute.Constant)
+_NUMERIC_FUNCTION = int(Attribute.NumericFunction)
+
+
+class AttributeTable:
+    """
+    Holds the attributes of all symbols by name, so that a symbol has the same attributes wherever it is used. The
+    kernel refers to the table as ``kernel.attributes``. Since expressions are shared between kernels and functions
+    are put into normal form when they are constructed, there is a single table, ``attribute_table``.
+
+    Functions take the attributes of their head when they are constructed. Changing the attributes of a symbol
+    therefore only affects functions constructed afterwards. Every change increases the ``version`` of the table, so
+    that kernels know to forget the results they found under the old attributes.
+    """
+
+    def __init__(self, attributes=None):
+        self.masks = {} if attributes is None else {name: int(mask) for name, mask in attributes.items()}
+        self.version = 0
+
+    def get(self, name):
+        """
+        Returns the attributes of the symbol with the given name.
+
+        **Parameters:**
+
+            *name* - The name of the symbol.
+
+        **Returns:**
+
+            The attributes as an :py:class:`~expressions.Attribute` flag.
+        """
+        return Attribute(self.masks.get(name, 0))
+
+    def set(self, name, attributes):
+        """
+        Replaces the attributes of the symbol with the given name.
+
+        **Parameters:**
+
+            *name* - The name of the symbol.
+
+            *attributes* - The new attributes as an :py:class:`~expressions.Attribute` flag.
+
+        **Returns:**
+
+            ``None``
+        """
+        if attributes:
+            self.masks[name] = int(attributes)
+        else:
+            self.masks.pop(name, None)
+        self.version += 1
+
+    def add(self, name, attributes):
+        """
+        Adds attributes to the symbol with the given name, keeping the attributes it already has.
+
+        **Parameters:**
+
+            *name* - The name of the symbol.
+
+            *attributes* - The attributes to add as an :py:class:`~expressions.Attribute` flag.
+
+        **Returns:**
+
+            ``None``
+        """
+        self.set(name, self.masks.get(name, 0) | int(attributes))
+
+
+attribute_table = AttributeTable(default_attributes)
+
+
+class Interned(type):
+    """
+    Metaclass of all expressions. It hash-conses expressions: constructing an expression that is structurally equal to
+    an existing one returns the existing object. Equal expressions are therefore always the same object, so equality
+    is an identity check, hashing is O(1) and repeated subexpressions are stored once.
+
+    Expressions are looked up by the key returned by their ``_intern_key`` method: a tuple of the class and the
+    already interned parts of the expression. Classes whose key can be computed from the constructor arguments
+    provide a ``_lookup_key`` class method, so that existing instances are found without constructing a new one first.
+    The table only holds weak references, so expressions that are no longer used are freed. Inserts into the table
+    hold a lock, so expressions constructed on several threads at once are interned as well.
+
+    Since equal expressions are the same object, expressions hash by identity. The hash isn't stored and doesn't
+    depend on the structure of the expression, so it varies between runs.
+    """
+
+    table = WeakValueDictionary()
+    lock = Lock()
+
+    def __call__(cls, *args, **kwargs):
+        key = cls._lookup_key(*args, **kwargs)
+        if key is not None:
+            expression = Interned.table.get(key)
+            if expression is not None:
+                return expression
+        expression = super().__call__(*args, **kwargs)
+        key = expression._intern_key()
+        # Another thread may have interned an equal expression since the lookup. The lookup and the insert have to be
+        # one step, so that both threads get the same object.
+        with Interned.lock:
+            existing = Interned.table.get(key)
+            if existing is not None:
+                return existing
+            Interned.table[key] = expression
+        return expression
+
+
+class InternedSequence(Interned):
+    """
+    Metaclass of :py:class:`~expressions.Sequence`. It turns the expressions into a tuple once before they are looked
+    up, so that the lookup and the constructor see the same expressions even if they are given as an iterator.
+    """
+
+    def __call__(cls, expressions):
+        return super().__call__(tuple(expressions))
 
 
-class Expression(Pattern):
+class Expression(Pattern, metaclass=Interned):
     """
-    Base class for all mathematical expressions. It consists of a head and a number of attributes. For a list of
-    attributes see :py:class:`~evaluation.Attribute`.
+    Base class for all mathematical expressions. It consists of a head and its attributes, an integer with one bit set
+    for every :py:class:`~expressions.Attribute` it has. Symbols look their attributes up in the
+    :py:class:`~expressions.AttributeTable`, functions take the attributes of their head and numbers are ``Numeric``
+    and ``Constant``.
     This is a base class and should not be instantiated. In some cases however it can be useful to subclass
     this class.
+
+    Expressions are interned (see :py:class:`~expressions.Interned`) and must not be modified after construction.
+    They declare ``__slots__`` to keep large trees small. Subclasses have to declare them as well, listing their own
+    fields, or their instances get a ``__dict__`` again.
     """
 
-    def __init__(self, head, attributes=None, constant=True):
+    # The fields starting with an underscore hold the values cached by the methods of this class.
+    __slots__ = ('head', '_summary', '_sort_key', '_normal_form', '_free_symbols', '__weakref__')
+
+    attributes = 0
+
+    def __init__(self, head, constant=True):
         super().__init__(constant)
         self.head = head
-        if attributes is None:
-            self.attributes = []
-        else:
-            self.attributes = attributes
 
-        if str(self.head) in default_attributes:
-            self.attributes += default_attributes[str(self.head)]
-
-    # FIXME: Attributes should really be stored in the kernel. Two different instances of Symbol with the same name
-    # FIXME: should have the same attributes.
     def has_attribute(self, attribute):
         """
         Returns a boolean value indicating whether this expression has the given attribute.
@@ -194,18 +452,166 @@ class Expression(Pattern):
 
             ``True`` if this expression has the given attribute. ``False`` otherwise.
         """
-        return attribute in self.attributes
+        return self.attributes & int(attribute) != 0
+
+    @classmethod
+    def _lookup_key(cls, *args, **kwargs):
+        return None
 
     def substitute(self, bindings):
-        if str(self.head) in bindings:
-            self.head = bindings[str(self.head)]
+        """
+        Returns this expression with the expressions bound to the names of symbols substituted for the symbols. Parts
+        of the expression that don't contain a bound symbol are shared with the result, not copied, and an expression
+        without any is returned as it is. The head of expressions other than functions names their type and is never
+        substituted.
+
+        **Parameters:**
+
+            *bindings* - The :py:class:`~expressions.Bindings` or a dictionary from names to expressions.
+
+        **Returns:**
+
+            The substituted expression.
+        """
         return self
 
-    def match(self, expression, bindings):
-        return SequenceMatchIterator([Match(bindings)]) if self == expression else SequenceMatchIterator([])
+    single = True
+
+    def single_match(self, expression, bindings):
+        return bindings if self == expression else None
+
+    def _compute_fingerprint(self):
+        return Fingerprint(self.head)
+
+    def summary(self):
+        """
+        Returns the :py:class:`~expressions.Fingerprint` of this expression, which is compared against the fingerprints
+        of patterns before matching them. It is computed once and cached.
+        """
+        try:
+            return self._summary
+        except AttributeError:
+            self._summary = self._compute_summary()
+            return self._summary
+
+    def _compute_summary(self):
+        return Fingerprint(self.head)
+
+    def sort_key(self):
+        """
+        Returns the key used to sort the arguments of ``Orderless`` functions into canonical order. The key is a
+        tuple starting with the kind of this expression: numbers, complex numbers, symbols, functions and then
+        everything else. The keys of subexpressions are nested in it rather than copied, so every node only stores
+        references to the keys of its parts. The key is computed once and cached. Keys of subexpressions that aren't
+        cached yet are computed bottom-up without recursion, so that deep expressions don't exhaust the stack.
+        """
+        try:
+            return self._sort_key
+        except AttributeError:
+            pass
+        stack = [self]
+        while stack:
+            expression = stack[-1]
+            if hasattr(expression, '_sort_key'):
+                stack.pop()
+                continue
+            parts = expression._sort_parts()
+            missing = [part for part in parts if isinstance(part, Expression) and not hasattr(part, '_sort_key')]
+            if missing:
+                stack.extend(missing)
+                continue
+            stack.pop()
+            expression._sort_key = tuple(part.sort_key() if isinstance(part, Pattern) else part for part in parts)
+        return self._sort_key
+
+    def _sort_parts(self):
+        """
+        Returns the values and subexpressions the sort key of this expression consists of, in order. Subexpressions
+        are replaced by their keys.
+        """
+        return [4, str(self)]
+
+    def size(self):
+        """
+        Returns the number of nodes of this expression, counting every occurrence of a repeated subexpression.
+        """
+        return 1
+
+    def free_symbols(self):
+        """
+        Returns the set of symbols occurring in this expression, including the heads of functions. Numbers do not
+        contain any symbols. The set is computed once from the sets of the parts and cached.
 
-    def __hash__(self):
-        return hash(self.head)
+        **Returns:**
+
+            A frozenset of :py:class:`Symbols<expressions.Symbol>`.
+        """
+        try:
+            return self._free_symbols
+        except AttributeError:
+            pass
+        stack = [self]
+        while stack:
+            node = stack[-1]
+            parts = [part for part in node._parts() if isinstance(part, Expression)]
+            pending = [part for part in parts if not hasattr(part, '_free_symbols')]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            if isinstance(node, Symbol):
+                node._free_symbols = frozenset((node,))
+            elif not parts:
+                node._free_symbols = frozenset()
+            else:
+                # Share the set of a part if the other parts do not add any symbols.
+                largest = max((part._free_symbols for part in parts), key=len)
+                symbols = largest.union(*(part._free_symbols for part in parts))
+                node._free_symbols = largest if len(symbols) == len(largest) else symbols
+        return self._free_symbols
+
+    def free_of(self, form):
+        """
+        Returns whether this expression does not contain the given expression. Symbols are looked up in
+        :py:meth:`~expressions.Expression.free_symbols`, other expressions are searched for among the heads and
+        arguments of functions.
+
+        **Parameters:**
+
+            *form* - The expression to look for.
+
+        **Returns:**
+
+            ``True`` if *form* does not occur in this expression. ``False`` otherwise.
+        """
+        if isinstance(form, Symbol):
+            return form not in self.free_symbols()
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node == form:
+                return False
+            if isinstance(node, Expression):
+                stack.extend(node._parts())
+        return True
+
+    def _parts(self):
+        """
+        Returns the subexpressions of this expression: the head and the arguments of a function and the elements of a
+        sequence.
+        """
+        return []
+
+    def _intern_key(self):
+        return type(self), self.head
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    __hash__ = object.__hash__
 
     def __str__(self):
         return str(self.head)
@@ -214,7 +620,7 @@ class Expression(Pattern):
         return str(self)
 
     def __eq__(self, other):
-        return isinstance(other, Expression) and other.head == self.head
+        return self is other
 
 
 class Symbol(Expression):
@@ -223,57 +629,104 @@ class Symbol(Expression):
     :math:`e` as well as other mathematical symbols like :math:`\infty`. Its head is the Symbol 'Symbol'.
     """
 
-    def __init__(self, name, attributes=None):
+    __slots__ = ('name',)
+
+    def __init__(self, name):
         self.name = name
-        if self.name in default_attributes:
-            attributes = attributes + default_attributes[self.name] if attributes is not None else default_attributes[
-                self.name]
         if name == 'Symbol':
-            super().__init__(self, attributes)
+            super().__init__(self)
         else:
-            super().__init__(Symbol('Symbol'), attributes)
+            super().__init__(Symbol('Symbol'))
+
+    @classmethod
+    def _lookup_key(cls, name):
+        return Symbol, name
+
+    @property
+    def attributes(self):
+        return attribute_table.masks.get(self.name, 0)
+
+    def _intern_key(self):
+        return Symbol, self.name
+
+    def _sort_parts(self):
+        return [2, self.name]
 
     def substitute(self, bindings):
         if self.name in bindings:
             return bindings[self.name]
         return self
 
-    def __eq__(self, other):
-        return isinstance(other, Symbol) and self.name == other.name
-
-    def __hash__(self):
-        return hash(self.name)
-
     def __str__(self):
         return self.name
 
 
 class Number(Expression):
     """
-    Base class for every number expression.
+    Base class for every number expression. Arithmetic on numbers is done on native Python values and only constructs
+    the result: integers and rationals are exact, an operation involving a :py:class:`~expressions.Real` is done in
+    floating point and complex numbers combine their parts.
     """
 
-    def __init__(self, head, attributes=None):
-        if attributes is None:
-            attributes = [Attribute.Numeric, Attribute.Constant]
-        else:
-            attributes += [Attribute.Numeric]
-        super().__init__(head, attributes)
+    __slots__ = ()
+
+    # Numbers never contain symbols.
+    _free_symbols = frozenset()
+
+    attributes = _NUMERIC | _CONSTANT
+
+    def __init__(self, head):
+        super().__init__(head)
+
+    def _exact(self):
+        """
+        Returns the value of this number as a tuple of its numerator and its positive denominator or ``None`` if it
+        isn't an exact real number.
+        """
+        return None
+
+    @staticmethod
+    def _from_exact(numerator, denominator):
+        # The numerator and the denominator have to be coprime and the denominator positive.
+        if denominator == 1:
+            return Integer.of(numerator)
+        return Rational(Integer.of(numerator), Integer.of(denominator), canonical=True)
 
     def __add__(self, other):
-        pass
+        if not isinstance(other, Number):
+            return NotImplemented
+        if isinstance(other, Complex):
+            return other.__add__(self)
+        exact = self._exact()
+        other_exact = other._exact()
+        if exact is None or other_exact is None:
+            return Real(float(self) + float(other))
+        return Number._from_exact(*Rational.add(*exact, *other_exact))
 
     def __sub__(self, other):
-        return self.__add__(other * Integer(-1))
+        return self.__add__(other * Integer.of(-1))
 
     def __mul__(self, other):
-        pass
+        if not isinstance(other, Number):
+            return NotImplemented
+        if isinstance(other, Complex):
+            return other.__mul__(self)
+        exact = self._exact()
+        other_exact = other._exact()
+        if exact is None or other_exact is None:
+            return Real(float(self) * float(other))
+        return Number._from_exact(*Rational.multiply(*exact, *other_exact))
 
     def __truediv__(self, other):
-        pass
-
-    def __eq__(self, other):
-        return isinstance(other, Number) and other.head == self.head
+        if not isinstance(other, Number):
+            return NotImplemented
+        if isinstance(other, Complex):
+            return Complex(self, Integer.of(0)).__truediv__(other)
+        exact = self._exact()
+        other_exact = other._exact()
+        if exact is None or other_exact is None:
+            return Real(float(self) / float(other))
+        return Number._from_exact(*Rational.divide(*exact, *other_exact))
 
 
 class Integer(Number):
@@ -281,229 +734,252 @@ class Integer(Number):
     Integer class representing an arbitrary sized integer. Its head is the Symbol 'Integer'.
     """
 
+    __slots__ = ('value',)
+
     def __init__(self, value):
         super().__init__(Symbol('Integer'))
         assert (isinstance(value, int))
         self.value = value
 
+    @classmethod
+    def _lookup_key(cls, value):
+        return Integer, value
+
+    @staticmethod
+    def of(value):
+        """
+        Returns the Integer with the given value. Small integers are kept alive in a table and taken from there
+        directly, all others are constructed.
+
+        **Parameters:**
+
+            *value* - The value as a Python ``int``.
+
+        **Returns:**
+
+            The :py:class:`~expressions.Integer`.
+        """
+        if _SMALL_INTEGERS_FROM <= value < _SMALL_INTEGERS_TO:
+            return _small_integers[value - _SMALL_INTEGERS_FROM]
+        return Integer(value)
+
+    def _intern_key(self):
+        return Integer, self.value
+
+    def _sort_parts(self):
+        return [0, self.value, 0]
+
+    def _exact(self):
+        return self.value, 1
+
+    def __float__(self):
+        return float(self.value)
+
     def __add__(self, other):
-        if isinstance(other, Integer):
-            return Integer(self.value + other.value)
-        if isinstance(other, Real):
-            return Real(self.value + other.value)
-        if isinstance(other, Rational):
-            return other.__add__(Rational(self, Integer(1)))
-        if isinstance(other, Complex):
-            tmp = Complex(other.real + self, other.imaginary)
-            if isinstance(tmp.imaginary, Integer) and tmp.imaginary.value == 0:
-                return tmp.real
-            return tmp
+        if type(other) is Integer:
+            return Integer.of(self.value + other.value)
+        return Number.__add__(self, other)
 
     def __mul__(self, other):
-        if isinstance(other, Integer):
-            return Integer(self.value * other.value)
-        if isinstance(other, Real):
-            return Real(self.value * other.value)
-        if isinstance(other, Rational):
-            return other.__mul__(Rational(self, Integer(1)))
-        if isinstance(other, Complex):
-            tmp = Complex(other.real * self, other.imaginary * self)
-            if isinstance(tmp.imaginary, Integer) and tmp.imaginary.value == 0:
-                return tmp.real
-            return tmp
-
-    def __truediv__(self, other):
-        if isinstance(other, Integer):
-            return Real(self.value / other.value)
-        if isinstance(other, Real):
-            return Real(self.value / other.value)
-        if isinstance(other, Rational):
-            tmp = Rational(self * other.denominator, other.numerator)
-            if tmp.numerator.value == 0:
-                return Integer(0)
-            if tmp.denominator.value == 1:
-                return tmp.numerator
-            return tmp
-        if isinstance(other, Complex):
-            return Complex(self, Integer(0)).__truediv__(other)
+        if type(other) is Integer:
+            return Integer.of(self.value * other.value)
+        return Number.__mul__(self, other)
 
     def __mod__(self, other):
         assert (isinstance(other, Integer))
-        return Integer(self.value % other.value)
-
-    def __hash__(self):
-        return hash('Integer') + hash(self.value)
-
-    def __eq__(self, other):
-        return isinstance(other, Integer) and other.value == self.value
+        return Integer.of(self.value % other.value)
 
     def __str__(self):
         return str(self.value)
 
 
+# The integers from -128 to 1023 are constructed once and never freed.
+_SMALL_INTEGERS_FROM = -128
+_SMALL_INTEGERS_TO = 1024
+_small_integers = tuple(Integer(value) for value in range(_SMALL_INTEGERS_FROM, _SMALL_INTEGERS_TO))
+
+
 class Real(Number):
     """
     Real class representing a double precision floating point number. Its head is the Symbol 'Real'.
     """
 
+    __slots__ = ('value',)
+
     def __init__(self, value):
         super().__init__(Symbol('Real'))
         assert (isinstance(value, float))
         self.value = value
 
-    def __add__(self, other):
-        if isinstance(other, Integer):
-            return Real(self.value + other.value)
-        if isinstance(other, Real):
-            return Real(self.value + other.value)
-        if isinstance(other, Rational):
-            return other.__add__(self)
-        if isinstance(other, Complex):
-            tmp = Complex(other.real + self, other.imaginary)
-            if isinstance(tmp.imaginary, Integer) and tmp.imaginary.value == 0:
-                return tmp.real
-            return tmp
+    @classmethod
+    def _lookup_key(cls, value):
+        # The sign keeps 0.0 and -0.0 apart.
+        return Real, value, copysign(1.0, value)
 
-    def __mul__(self, other):
-        if isinstance(other, Integer):
-            return Real(self.value * other.value)
-        if isinstance(other, Real):
-            return Real(self.value * other.value)
-        if isinstance(other, Rational):
-            return other.__mul__(self)
-        if isinstance(other, Complex):
-            tmp = Complex(other.real * self, other.imaginary * self)
-            if isinstance(tmp.imaginary, Integer) and tmp.imaginary.value == 0:
-                return tmp.real
-            return tmp
+    def _intern_key(self):
+        return Real, self.value, copysign(1.0, self.value)
 
-    def __truediv__(self, other):
-        if isinstance(other, Integer):
-            return Real(self.value / other.value)
-        if isinstance(other, Real):
-            return Real(self.value / other.value)
-        if isinstance(other, Rational):
-            return Real(self * other.denominator / other.numerator)
-        if isinstance(other, Complex):
-            return Complex(self, Integer(0)).__truediv__(other)
+    def _sort_parts(self):
+        return [0, self.value, 2]
+
+    def __float__(self):
+        return self.value
 
     def __str__(self):
         return str(self.value)
 
-    def __hash__(self):
-        return hash(self.head) + hash(self.value)
-
-    def __eq__(self, other):
-        return isinstance(other, Real) and other.value == self.value
-
 
 class Rational(Number):
     """
     Rational class representing an arbitrary rational number. Its numerator and denominator are arbitrary integers.
+    A rational number of two :py:class:`Integers<expressions.Integer>` is reduced to lowest terms with a positive
+    denominator, unless the caller passes ``canonical=True`` to promise that it already is.
+
+    The arithmetic on exact numbers is done on pairs of Python integers by the static methods of this class, which
+    keep the numbers small by dividing out common factors before multiplying. If gmpy2 is installed, its integers are
+    used for these methods.
     """
 
-    def __init__(self, numerator, denominator):
+    __slots__ = ('numerator', 'denominator')
+
+    def __init__(self, numerator, denominator, canonical=False):
         super().__init__(Symbol('Rational'))
 
-        if isinstance(numerator, Integer) and isinstance(denominator, Integer) and denominator.value != 0:
-            gcd = Rational.gcd(numerator, denominator)
-            denominator = Integer(int(denominator.value / gcd.value))
-            numerator = Integer(int(numerator.value / gcd.value))
-            if denominator.value < 0 and numerator.value < 0:
-                denominator = Integer(abs(denominator.value))
-                numerator = Integer(abs(numerator.value))
-            if denominator.value < 0 < numerator.value:
-                denominator = Integer(abs(denominator.value))
-                numerator = Integer(-1 * numerator.value)
+        if not canonical and isinstance(numerator, Integer) and isinstance(denominator, Integer) and \
+                denominator.value != 0:
+            numerator_value, denominator_value = Rational.normalize(numerator.value, denominator.value)
+            if numerator_value != numerator.value or denominator_value != denominator.value:
+                numerator = Integer.of(numerator_value)
+                denominator = Integer.of(denominator_value)
 
         self.numerator = numerator
         self.denominator = denominator
 
+    @classmethod
+    def _lookup_key(cls, numerator, denominator, canonical=False):
+        # Only the key of a rational number that is already in lowest terms is known before constructing it.
+        if canonical:
+            return Rational, numerator, denominator
+        return None
+
+    def _intern_key(self):
+        return Rational, self.numerator, self.denominator
+
+    def _sort_parts(self):
+        if isinstance(self.numerator, Integer) and isinstance(self.denominator, Integer) and \
+                self.denominator.value != 0:
+            return [0, Fraction(self.numerator.value, self.denominator.value), 1]
+        return [4, 'Rational', self.numerator, self.denominator]
+
+    def _exact(self):
+        if isinstance(self.numerator, Integer) and isinstance(self.denominator, Integer) and \
+                self.denominator.value != 0:
+            return self.numerator.value, self.denominator.value
+        return None
+
+    def __float__(self):
+        return self.numerator.value / self.denominator.value
+
+    single = False
+    single_match = Pattern.single_match
+
     def match(self, expression, bindings):
         if not isinstance(expression, Rational):
-            return SequenceMatchIterator([])
+            return
+        for b in self.numerator.match(expression.numerator, bindings):
+            yield from self.denominator.match(expression.denominator, b)
 
-        numerator_match = self.numerator.match(expression.numerator, bindings)
+    @staticmethod
+    def normalize(numerator, denominator):
+        """
+        Reduces a fraction of two integers to lowest terms with a positive denominator.
 
-        return SubMatchIterator(lambda m: self.denominator.match(expression.denominator,
-                                                                 m.bindings), numerator_match)
+        **Parameters:**
 
-    def __add__(self, other):
-        if isinstance(other, Integer):
-            return self.__add__(Rational(other, Integer(1)))
-        if isinstance(other, Real):
-            return self.numerator / self.denominator + other
-        if isinstance(other, Rational):
-            tmp = Rational(self.numerator * other.denominator + self.denominator * other.numerator,
-                           self.denominator * other.denominator)
-            if tmp.numerator.value == 0:
-                return Integer(0)
-            if tmp.denominator.value == 1:
-                return tmp.numerator
-            return tmp
-        if isinstance(other, Complex):
-            tmp = Complex(other.real + self, other.imaginary)
-            if isinstance(tmp.imaginary, Integer) and tmp.imaginary.value == 0:
-                return tmp.real
-            return tmp
+            *numerator* - The numerator as a Python ``int``.
 
-    def __mul__(self, other):
-        if isinstance(other, Integer):
-            return self.__mul__(Rational(other, Integer(1)))
-        if isinstance(other, Real):
-            return self.numerator / self.denominator * other
-        if isinstance(other, Rational):
-            tmp = Rational(self.numerator * other.numerator, self.denominator * other.denominator)
-            if tmp.numerator.value == 0:
-                return Integer(0)
-            if tmp.denominator.value == 1:
-                return tmp.numerator
-            return tmp
-        if isinstance(other, Complex):
-            tmp = Complex(other.real * self, other.imaginary * self)
-            if isinstance(tmp.imaginary, Integer) and tmp.imaginary.value == 0:
-                return tmp.real
-            return tmp
+            *denominator* - The denominator as a Python ``int``, which must not be zero.
 
-    def __truediv__(self, other):
-        if isinstance(other, Integer):
-            tmp = Rational(self.numerator, self.denominator * other)
-            if tmp.numerator.value == 0:
-                return Integer(0)
-            if tmp.denominator.value == 1:
-                return tmp.numerator
-            return tmp
-        if isinstance(other, Real):
-            return Real((self.numerator / self.denominator) / other.value)
-        if isinstance(other, Rational):
-            return self * Rational(other.denominator, other.numerator)
-        if isinstance(other, Complex):
-            return Complex(self, Integer(0)).__truediv__(other)
+        **Returns:**
+
+            A tuple of the reduced numerator and denominator.
+        """
+        divisor = int(_gcd(numerator, denominator))
+        if denominator < 0:
+            divisor = -divisor
+        if divisor == 1:
+            return numerator, denominator
+        return numerator // divisor, denominator // divisor
+
+    @staticmethod
+    def add(numerator, denominator, other_numerator, other_denominator):
+        """
+        Adds two fractions in lowest terms with positive denominators, like :py:class:`fractions.Fraction` does.
+
+        **Returns:**
+
+            A tuple of the numerator and the denominator of the sum, in lowest terms.
+        """
+        if denominator == 1 and other_denominator == 1:
+            return numerator + other_numerator, 1
+        n, d, m, e = _integer(numerator), _integer(denominator), _integer(other_numerator), _integer(other_denominator)
+        divisor = _gcd(d, e)
+        if divisor == 1:
+            return int(n * e + m * d), int(d * e)
+        s = d // divisor
+        t = n * (e // divisor) + m * s
+        second_divisor = _gcd(t, divisor)
+        if second_divisor == 1:
+            return int(t), int(s * e)
+        return int(t // second_divisor), int(s * (e // second_divisor))
+
+    @staticmethod
+    def multiply(numerator, denominator, other_numerator, other_denominator):
+        """
+        Multiplies two fractions in lowest terms with positive denominators, like :py:class:`fractions.Fraction` does.
+
+        **Returns:**
+
+            A tuple of the numerator and the denominator of the product, in lowest terms.
+        """
+        if denominator == 1 and other_denominator == 1:
+            return numerator * other_numerator, 1
+        n, d, m, e = _integer(numerator), _integer(denominator), _integer(other_numerator), _integer(other_denominator)
+        first_divisor = _gcd(n, e)
+        if first_divisor > 1:
+            n //= first_divisor
+            e //= first_divisor
+        second_divisor = _gcd(m, d)
+        if second_divisor > 1:
+            m //= second_divisor
+            d //= second_divisor
+        return int(n * m), int(d * e)
+
+    @staticmethod
+    def divide(numerator, denominator, other_numerator, other_denominator):
+        """
+        Divides two fractions in lowest terms with positive denominators.
+
+        **Returns:**
+
+            A tuple of the numerator and the denominator of the quotient, in lowest terms.
+
+        **Raises:**
+
+            *ZeroDivisionError* if the divisor is zero.
+        """
+        if other_numerator == 0:
+            raise ZeroDivisionError('Rational division by zero')
+        if other_numerator < 0:
+            return Rational.multiply(numerator, denominator, -other_denominator, -other_numerator)
+        return Rational.multiply(numerator, denominator, other_denominator, other_numerator)
 
     @staticmethod
     def gcd(a, b):
         """
         Calculates the greatest common divisor of two :py:class:`Integers<expressions.Integer>`.
         """
-        x = Integer(abs(a.value))
-        y = Integer(abs(b.value))
-
-        if x.value == 0 and y.value == 0:
-            return Integer(0)
-        elif x.value == 0:
-            return y
-        elif y.value == 0:
-            return x
-        elif x.value % 2 == 0 and y.value % 2 == 0:
-            return Integer(2 * Rational.gcd(Integer(x.value // 2), Integer(y.value // 2)).value)
-        elif x.value % 2 == 0:
-            return Rational.gcd(Integer(x.value // 2), y)
-        elif y.value % 2 == 0:
-            return Rational.gcd(x, Integer(y.value // 2))
-        elif x.value >= y.value:
-            return Rational.gcd(Integer((x.value - y.value) // 2), y)
-        else:
-            return Rational.gcd(Integer((y.value - x.value) // 2), x)
+        return Integer.of(int(_gcd(a.value, b.value)))
 
     @staticmethod
     def lcm(x, y):
@@ -516,104 +992,71 @@ class Rational(Number):
     def __str__(self):
         return "Rational[" + str(self.numerator) + ", " + str(self.denominator) + "]"
 
-    def __eq__(self, other):
-        return isinstance(other,
-                          Rational) and other.numerator == self.numerator and other.denominator == self.denominator
-
-    def __hash__(self):
-        return hash(self.head) + hash(self.numerator) + hash(self.denominator)
-
 
 class Complex(Number):
     """
-    Complex class representing complex numbers. It consists of a real and an imaginary part.
+    Complex class representing complex numbers. It consists of a real and an imaginary part. Arithmetic on complex
+    numbers is done on their parts, so it is exact if the parts are.
     """
 
+    __slots__ = ('real', 'imaginary')
+
     def __init__(self, real, imaginary):
         super().__init__(Symbol('Complex'))
         assert (isinstance(real, Number) and isinstance(imaginary, Number))
+        if isinstance(real, Complex):
+            imaginary += real.imaginary
+            real = real.real
+        if isinstance(imaginary, Complex):
+            real -= imaginary.imaginary
+            imaginary = imaginary.real
         self.real = real
         self.imaginary = imaginary
 
-        if isinstance(self.real, Complex):
-            self.imaginary += self.real.imaginary
-            self.real = self.real.real
-        if isinstance(self.imaginary, Complex):
-            self.real -= self.imaginary.imaginary
-            self.imaginary = self.imaginary.real
+    @staticmethod
+    def _of(real, imaginary):
+        # A result without an exact imaginary part is real.
+        if isinstance(imaginary, Integer) and imaginary.value == 0:
+            return real
+        return Complex(real, imaginary)
 
-    def match(self, expression, bindings):
-        if not isinstance(expression, Complex):
-            return SequenceMatchIterator([])
+    def _intern_key(self):
+        return Complex, self.real, self.imaginary
 
-        real_match = self.real.match(expression.real, bindings)
+    def _sort_parts(self):
+        return [1, self.real, self.imaginary]
 
-        return SubMatchIterator(lambda m: self.imaginary.match(expression.argument_sequence,
-                                                               m.bindings), real_match)
+    single = False
+    single_match = Pattern.single_match
+
+    def match(self, expression, bindings):
+        if not isinstance(expression, Complex):
+            return
+        for b in self.real.match(expression.real, bindings):
+            yield from self.imaginary.match(expression.imaginary, b)
 
     def __add__(self, other):
         if isinstance(other, Complex):
-            tmp = Complex(self.real + other.real, self.imaginary + other.imaginary)
-            if isinstance(tmp.imaginary, Integer) and tmp.imaginary.value == 0:
-                return tmp.real
-            return tmp
-        else:
-            tmp = Complex(self.real + other, self.imaginary)
-            if isinstance(tmp.imaginary, Integer) and tmp.imaginary.value == 0:
-                return tmp.real
-            return tmp
+            return Complex._of(self.real + other.real, self.imaginary + other.imaginary)
+        return Complex._of(self.real + other, self.imaginary)
 
     def __mul__(self, other):
-        if isinstance(other, Integer):
-            tmp = Complex(self.real * other, self.imaginary * other)
-            if isinstance(tmp.imaginary, Integer) and tmp.imaginary.value == 0:
-                return tmp.real
-            return tmp
-        if isinstance(other, Real):
-            tmp = Complex(self.real * other, self.imaginary * other)
-            if isinstance(tmp.imaginary, Integer) and tmp.imaginary.value == 0:
-                return tmp.real
-            return tmp
-        if isinstance(other, Rational):
-            tmp = Complex(self.real * other, self.imaginary * other)
-            if isinstance(tmp.imaginary, Integer) and tmp.imaginary.value == 0:
-                return tmp.real
-            return tmp
         if isinstance(other, Complex):
-            tmp = Complex(self.real * other.real - self.imaginary * other.imaginary,
-                          self.real * other.imaginary + self.imaginary * other.real)
-            if isinstance(tmp.imaginary, Integer) and tmp.imaginary.value == 0:
-                return tmp.real
-            return tmp
+            return Complex._of(self.real * other.real - self.imaginary * other.imaginary,
+                               self.real * other.imaginary + self.imaginary * other.real)
+        return Complex._of(self.real * other, self.imaginary * other)
 
     def __truediv__(self, other):
-        if isinstance(other, Complex):
-            div = other.real * other.real + other.imaginary * other.imaginary
-            tmp = Complex(self.real * other.real + self.imaginary * other.imaginary,
-                          self.imaginary * other.real - self.real * other.imaginary)
-            if isinstance(tmp.real, Integer) and isinstance(div, Integer):
-                tmp.real = Rational(tmp.real, div) * Integer(1)
-            else:
-                tmp.real = tmp.real / div
-            if isinstance(tmp.imaginary, Integer) and isinstance(div, Integer):
-                tmp.imaginary = Rational(tmp.imaginary, div) * Integer(1)
-            else:
-                tmp.imaginary = tmp.imaginary / div
-            if isinstance(tmp.imaginary, Integer) and tmp.imaginary.value == 0:
-                return tmp.real
-            return tmp
-        else:
-            return self / Complex(other, Integer(0))
+        if not isinstance(other, Complex):
+            return Complex._of(self.real / other, self.imaginary / other)
+        div = other.real * other.real + other.imaginary * other.imaginary
+        real = self.real * other.real + self.imaginary * other.imaginary
+        imaginary = self.imaginary * other.real - self.real * other.imaginary
+        return Complex._of(real / div, imaginary / div)
 
     def __str__(self):
         return "Complex[" + str(self.real) + ", " + str(self.imaginary) + "]"
 
-    def __eq__(self, other):
-        return isinstance(other, Complex) and other.real == self.real and other.imaginary == self.imaginary
-
-    def __hash__(self):
-        return hash(self.head) + hash(self.real) + hash(self.imaginary)
-
 
 class Function(Expression):
     """
@@ -621,55 +1064,236 @@ class Function(Expression):
     applied to. The attributes of the head will influence how this function is evaluated. If its head has the
     ``Orderless`` attribute this function will reorder its arguments into a canonical form:
 
-        1. Integers
-        2. Reals
-        3. Symbols
-        4. Functions
+        1. Numbers, by value
+        2. Complex numbers
+        3. Symbols, by name
+        4. Functions, by head and then by arguments
+        5. Patterns
 
     If its head has the ``Flat`` attribute this function will flatten any nested function calls.
     For a complete list of attributes see :py:class:`~expressions.Attribute`.
+
+    Callers that know the arguments already are in this normal form, for example because they are taken in order from
+    a function with the same head, pass ``canonical=True`` to skip flattening and sorting them. Setting
+    ``Function.verify_canonical`` to ``True`` checks this guarantee and raises a *ValueError* if it is broken.
     """
 
-    def __init__(self, head, argument_sequence, attributes=None):
+    __slots__ = ('argument_sequence', 'attributes', '_size')
+
+    verify_canonical = False
+
+    def __init__(self, head, argument_sequence, attributes=None, canonical=False):
         if isinstance(head, str):
             head = Symbol(head)
-        constant = head.constant and argument_sequence.constant
-        if attributes is not None:
-            super().__init__(head, [Attribute.Flat], constant)
-        else:
-            if isinstance(head, Pattern):
-                super().__init__(head, [], constant)
-            else:
-                super().__init__(head, head.attributes, constant)
-
-        if self.has_attribute(Attribute.Flat):
-            argument_sequence = argument_sequence.flatten(self.head)
+        super().__init__(head, head.constant and argument_sequence.constant)
+        # Attributes passed in are added to those of the head.
+        attributes = 0 if attributes is None else int(attributes)
+        if isinstance(head, Symbol):
+            attributes |= head.attributes
+
+        if not canonical or Function.verify_canonical:
+            normalized = argument_sequence
+            if attributes & _FLAT:
+                normalized = normalized.flatten(head)
+            if attributes & _ORDERLESS:
+                normalized = normalized.sort()
+            if canonical and normalized is not argument_sequence:
+                raise ValueError('The arguments of ' + str(head) + ' are not in normal form: ' + str(argument_sequence))
+            argument_sequence = normalized
+        self.argument_sequence = argument_sequence
+
+        if attributes & _NUMERIC_FUNCTION and argument_sequence.has_attribute(Attribute.Numeric):
+            attributes |= _NUMERIC
+        self.attributes = attributes
+
+    @classmethod
+    def _lookup_key(cls, head, argument_sequence, attributes=None, canonical=False):
+        # Interned functions hold normalized arguments, so a lookup with arguments that are not flattened or sorted yet
+        # cannot find a function it should not find. The key holds the attributes the function will have, so functions
+        # with the same parts but other attributes are different expressions.
+        if isinstance(head, str):
+            head = Symbol(head)
+        attributes = 0 if attributes is None else int(attributes)
+        if isinstance(head, Symbol):
+            attributes |= head.attributes
+        if attributes & _NUMERIC_FUNCTION and argument_sequence.has_attribute(Attribute.Numeric):
+            attributes |= _NUMERIC
+        return Function, head, argument_sequence, attributes
+
+    def _intern_key(self):
+        return Function, self.head, self.argument_sequence, self.attributes
+
+    def _sort_parts(self):
+        arguments = self.argument_sequence.expressions
+        return [3, self.head, len(arguments), *arguments]
+
+    def _parts(self):
+        return [self.head, *self.argument_sequence.expressions]
+
+    def size(self):
+        try:
+            return self._size
+        except AttributeError:
+            pass
+        # Compute the sizes of nested functions first, deepest first, so that every node only sums up its parts.
+        stack = [self]
+        while stack:
+            node = stack[-1]
+            parts = [node.head, *node.argument_sequence.expressions]
+            pending = [part for part in parts if isinstance(part, Function) and not hasattr(part, '_size')]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            node._size = 1 + sum(part.size() for part in parts)
+        return self._size
 
-        if self.has_attribute(Attribute.Orderless):
-            self.argument_sequence = argument_sequence.sort()
-        else:
-            self.argument_sequence = argument_sequence
+    def substitute(self, bindings):
+        return Function._substitute(self, bindings)
 
-        numeric = self.has_attribute(Attribute.NumericFunction) and self.argument_sequence.has_attribute(
-            Attribute.Numeric)
+    @staticmethod
+    def _substitute(root, bindings):
+        """
+        Substitutes the bindings in a function or sequence without recursion. Functions and sequences are rebuilt in
+        postorder from their substituted parts, which are collected on a stack of values, and are kept as they are if
+        no part changed. Subexpressions whose free symbols don't include a bound name are kept without visiting their
+        parts. All other expressions substitute themselves.
+        """
+        bound = {Symbol(name) for name in bindings.keys()}
+        values = []
+        stack = [(root, False)]
+        while stack:
+            node, visited = stack.pop()
+            if isinstance(node, Function):
+                parts = [node.head, *node.argument_sequence.expressions]
+            elif isinstance(node, Sequence):
+                parts = node.expressions
+            else:
+                values.append(node.substitute(bindings))
+                continue
+            if not visited:
+                if bound.isdisjoint(node.free_symbols()):
+                    values.append(node)
+                    continue
+                stack.append((node, True))
+                stack.extend((part, False) for part in reversed(parts))
+                continue
+            new_parts = values[len(values) - len(parts):]
+            del values[len(values) - len(parts):]
+            if all(new is old for new, old in zip(new_parts, parts)):
+                values.append(node)
+            elif isinstance(node, Function):
+                values.append(Function._rebuild(node, new_parts))
+            else:
+                values.append(Sequence(new_parts))
+        return values[0]
 
-        if numeric:
-            self.attributes.append(Attribute.Numeric)
+    @staticmethod
+    def _rebuild(node, parts):
+        """
+        Returns the function with the given head and arguments, which are the parts of *node* with some of them
+        replaced. Since *node* is in normal form, only the replaced arguments can break it. If none of them has to be
+        spliced into a ``Flat`` function or moved in an ``Orderless`` one, the function is constructed without
+        normalizing its arguments again. This doesn't hold if the head was made ``Flat`` or ``Orderless`` after *node*
+        was constructed, and then the arguments are normalized.
+        """
+        head = parts[0]
+        arguments = parts[1:]
+        canonical = head is node.head
+        if canonical and isinstance(head, Symbol) and head.attributes & ~node.attributes & (_FLAT | _ORDERLESS):
+            canonical = False
+        flat = node.attributes & _FLAT
+        orderless = node.attributes & _ORDERLESS
+        if canonical and (flat or orderless):
+            old = node.argument_sequence.expressions
+            last = len(arguments) - 1
+            for i, argument in enumerate(arguments):
+                if argument is old[i]:
+                    continue
+                if flat and isinstance(argument, Function) and argument.head == head:
+                    canonical = False
+                    break
+                if orderless:
+                    key = argument.sort_key()
+                    if i > 0 and arguments[i - 1].sort_key() > key or i < last and key > arguments[i + 1].sort_key():
+                        canonical = False
+                        break
+        return Function(head, Sequence(arguments), canonical=canonical)
 
-    def substitute(self, bindings):
-        new_head = self.head.substitute(bindings)
-        new_argument_sequence = self.argument_sequence.substitute(bindings)
-        return Function(new_head, new_argument_sequence)
+    @staticmethod
+    def _to_string(root):
+        """
+        Returns the string form of a function or sequence without recursion. Functions and sequences are expanded into
+        their parts and the punctuation between them on a stack, all other expressions are converted by ``str``.
+        """
+        pieces = []
+        stack = [root]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                pieces.append(item)
+                continue
+            if isinstance(item, Function):
+                arguments = item.argument_sequence.expressions
+            elif isinstance(item, Sequence):
+                arguments = item.expressions
+            else:
+                pieces.append(str(item))
+                continue
+            stack.append(']')
+            for i in range(len(arguments) - 1, -1, -1):
+                stack.append(arguments[i])
+                if i > 0:
+                    stack.append(', ')
+            stack.append('[')
+            if isinstance(item, Function):
+                stack.append(item.head)
+        return ''.join(pieces)
+
+    single = False
+    single_match = Pattern.single_match
 
     def match(self, expression, bindings):
         if not isinstance(expression, Function):
-            return SequenceMatchIterator([])
-        head_match = self.head.match(expression.head, bindings)
-        orderless = self.has_attribute(Attribute.Orderless)
-        flat = self.has_attribute(Attribute.Flat)
-        return SubMatchIterator(lambda m: self.argument_sequence.match(expression.argument_sequence,
-                                                                       m.bindings, orderless=orderless, flat=flat,
-                                                                       head=self.head), head_match)
+            return
+        orderless = self.attributes & _ORDERLESS != 0
+        flat = self.attributes & _FLAT != 0
+        if self.head.single:
+            bindings = self.head.single_match(expression.head, bindings)
+            if bindings is not None:
+                yield from self.argument_sequence.match(expression.argument_sequence, bindings, orderless=orderless,
+                                                        flat=flat, head=self.head)
+            return
+        for b in self.head.match(expression.head, bindings):
+            yield from self.argument_sequence.match(expression.argument_sequence, b, orderless=orderless, flat=flat,
+                                                    head=self.head)
+
+    def _compute_fingerprint(self):
+        if not isinstance(self.head, Expression) or not self.head.constant:
+            return Fingerprint()
+        flat = self.attributes & _FLAT != 0
+        arguments = set()
+        for argument in self.argument_sequence.expressions:
+            if isinstance(argument, BoundPattern):
+                argument = argument.base_pattern
+            if isinstance(argument, Function):
+                head = argument.head if isinstance(argument.head, Expression) and argument.head.constant else None
+            elif isinstance(argument, Blank):
+                head = argument.head
+            else:
+                head = None
+            # Under a Flat head an argument pattern with the same head may match a group of arguments.
+            if head is not None and not (flat and head == self.head):
+                arguments.add(head)
+            if isinstance(argument, (Symbol, Integer, Real)):
+                arguments.add(argument)
+        return Fingerprint(self.head, None if flat else len(self.argument_sequence), frozenset(arguments))
+
+    def _compute_summary(self):
+        arguments = set()
+        for argument in self.argument_sequence.expressions:
+            arguments.update(Fingerprint.tokens(argument))
+        return Fingerprint(self.head, len(self.argument_sequence), frozenset(arguments))
 
     def __getitem__(self, item):
         if item == 0:
@@ -678,28 +1302,45 @@ class Function(Expression):
             return self.argument_sequence[item - 1]
 
     def __str__(self):
-        return str(self.head) + str(self.argument_sequence)
-
-    def __hash__(self):
-        return hash(self.head) + hash(self.argument_sequence)
-
-    def __eq__(self, other):
-        return isinstance(other,
-                          Function) and other.head == self.head and other.argument_sequence == self.argument_sequence
+        return Function._to_string(self)
 
 
-class Sequence(Expression):
+class Sequence(Expression, metaclass=InternedSequence):
     """
-    Sequence class representing a sequence of expressions. This class is used for the arguments of a function.
+    Sequence class representing a sequence of expressions. This class is used for the arguments of a function. The
+    expressions are stored in a tuple.
     """
 
+    __slots__ = ('expressions',)
+
+    single = False
+    single_match = Pattern.single_match
+
     def __init__(self, expressions):
+        expressions = tuple(expressions)
         constant = all([expression.constant for expression in expressions])
         super().__init__(Symbol('Sequence'), constant=constant)
         self.expressions = expressions
-        self.position = 0
+
+    # The key of a sequence is the tuple of its expressions itself. It can't be equal to the key of another class,
+    # since those start with the class. The metaclass has already turned the expressions into a tuple.
+    @classmethod
+    def _lookup_key(cls, expressions):
+        return expressions
+
+    def _intern_key(self):
+        return self.expressions
+
+    def _parts(self):
+        return list(self.expressions)
 
     def flatten(self, head):
+        """
+        Returns this sequence with the arguments of functions with the given head spliced in for the functions. A
+        sequence without such functions is returned as it is.
+        """
+        if not any(isinstance(argument, Function) and argument.head == head for argument in self.expressions):
+            return self
         new_expressions = []
         for argument in self.expressions:
             if isinstance(argument, Function) and argument.head == head:
@@ -709,15 +1350,24 @@ class Sequence(Expression):
         return Sequence(new_expressions)
 
     def sort(self, key=None):
+        """
+        Returns this sequence sorted by the given key, or into canonical order by
+        :py:meth:`~expressions.Expression.sort_key` if no key is given. A sequence that is already sorted is returned
+        as it is.
+        """
         if key is None:
-            key = str
-        return Sequence(sorted(self.expressions, key=key))
+            key = Sequence._canonical_key
+        keys = [key(expression) for expression in self.expressions]
+        if all(keys[i] <= keys[i + 1] for i in range(len(keys) - 1)):
+            return self
+        return Sequence([expression for _, expression in sorted(zip(keys, self.expressions), key=lambda item: item[0])])
+
+    @staticmethod
+    def _canonical_key(expression):
+        return expression.sort_key()
 
     def substitute(self, bindings):
-        new_expressions = []
-        for argument in self.expressions:
-            new_expressions.append(argument.substitute(bindings))
-        return Sequence(new_expressions)
+        return Function._substitute(self, bindings)
 
     def match(self, expression, bindings, orderless=False, flat=False, head=None):
         if orderless and flat:
@@ -728,13 +1378,10 @@ class Sequence(Expression):
             matcher = FlatSequenceMatcher(expression.to_list(), self.to_list(), bindings, head)
         else:
             matcher = SequenceMatcher(expression.to_list(), self.to_list(), bindings)
-        return matcher.__iter__()
+        return iter(matcher)
 
     def to_list(self):
-        return [expression for expression in self]
-
-    def __delitem__(self, key):
-        del self.expressions[key]
+        return list(self.expressions)
 
     def __len__(self):
         return len(self.expressions)
@@ -742,34 +1389,26 @@ class Sequence(Expression):
     def __getitem__(self, item):
         return self.expressions[item]
 
-    def __next__(self):
-        if self.position < len(self):
-            self.position += 1
-            return self[self.position]
-        raise StopIteration()
-
-    def __hash__(self):
-        h = 0
-        for expression in self.expressions:
-            h += hash(expression)
-        return h
+    def __iter__(self):
+        return iter(self.expressions)
 
     def __str__(self):
-        return "[" + ", ".join(map(str, self.expressions)) + "]"
-
-    def __eq__(self, other):
-        return isinstance(other, Sequence) and other.expressions == self.expressions
+        return Function._to_string(self)
 
 
 class Bindings:
     """
-    The Bindings class keeps track of all the bindings in the matching process. Bindings are stored as a list of tuples
-    (name, expression).
+    The Bindings class keeps track of all the bindings in the matching process. Bindings are immutable: binding a name
+    returns new bindings that point back to the bindings they extend, so extending is O(1) and different branches of
+    the matching process can share everything they have in common. A lookup walks back through the chain, which is
+    never longer than the number of variables of the pattern being matched.
     """
 
-    def __init__(self):
-        self.bindings = set([])
-        self.position = 0
+    def __init__(self, name=None, expression=None, parent=None):
+        self.name = name
+        self.expression = expression
+        self.parent = parent
+        self.size = 0 if parent is None else parent.size + 1
 
     def bind(self, name, expression):
         """
@@ -783,9 +1422,9 @@ class Bindings:
 
         **Returns:**
 
-            ``None``
+            New bindings containing these bindings and the new one.
         """
-        self.bindings.add((name, expression))
+        return Bindings(name, expression, self)
 
     def remove(self, name):
         """
@@ -797,120 +1436,75 @@ class Bindings:
 
         **Returns**:
 
-            ``None``
+            New bindings containing all of these bindings except the removed one.
 
         **Raises:**
 
             *KeyError* if no binding with *name* as name exists.
         """
-        self.bindings.remove((name, self[name]))
+        removed = []
+        frame = self
+        while frame.parent is not None and frame.name != name:
+            removed.append(frame)
+            frame = frame.parent
+        if frame.parent is None:
+            raise KeyError(name)
+        frame = frame.parent
+        for binding in reversed(removed):
+            frame = frame.bind(binding.name, binding.expression)
+        return frame
 
     def union(self, other):
-        b = Bindings()
-        for name, expression in other.bindings:
-            b.bind(name, expression)
-        for name, expression in self.bindings:
-            b.bind(name, expression)
+        """
+        Returns bindings containing these bindings and all bindings of *other* whose name isn't bound here.
+        """
+        b = self
+        for name, expression in other.items():
+            if name not in b:
+                b = b.bind(name, expression)
         return b
 
+    def items(self):
+        """
+        Returns a list of (name, expression) tuples in the order the names were bound.
+        """
+        items = []
+        frame = self
+        while frame.parent is not None:
+            items.append((frame.name, frame.expression))
+            frame = frame.parent
+        items.reverse()
+        return items
+
     def __getitem__(self, key):
-        for name, expression in self.bindings:
-            if name == key:
-                return expression
-        raise KeyError()
+        frame = self
+        while frame.parent is not None:
+            if frame.name == key:
+                return frame.expression
+            frame = frame.parent
+        raise KeyError(key)
 
     def __contains__(self, key):
-        for name, expression in self.bindings:
-            if name == key:
+        frame = self
+        while frame.parent is not None:
+            if frame.name == key:
                 return True
+            frame = frame.parent
         return False
 
-    def keys(self):
-        keys = []
-        for binding in self.bindings:
-            keys.append(binding[0])
-        return keys
-
-    def __str__(self):
-        return "{" + ", ".join([str(name) + ' -> ' + str(expression) for name, expression in self.bindings]) + "}"
-
-    def __repr__(self):
-        return str(self)
-
-
-class Match:
-    """
-    A single match consisting of the matched expression, the pattern and the bindings.
-    """
+    def __len__(self):
+        return self.size
 
-    def __init__(self, bindings=None):
-        if bindings is None:
-            bindings = Bindings()
-        self.bindings = bindings
+    def keys(self):
+        return [name for name, _ in self.items()]
 
     def __str__(self):
-        return str(self.bindings)
+        return "{" + ", ".join([str(name) + ' -> ' + str(expression) for name, expression in self.items()]) + "}"
 
     def __repr__(self):
         return str(self)
 
 
-class MatchIterator(Iterator):
-    """
-
-    """
-
-    pass
-
-
-class SequenceMatchIterator(Iterator):
-    """
-    Iterator over many :py:class:`matches<matching.Match>`.
-    """
-
-    def __init__(self, matches):
-        self.matches = matches
-        self.position = 0
-
-    def add_match(self, match):
-        self.matches.append(match)
-
-    def add_matches(self, iterator):
-        for match in iterator:
-            self.add_match(match)
-
-    def __len__(self):
-        return len(self.matches)
-
-    def __next__(self):
-        if self.position >= len(self):
-            raise StopIteration()
-        item = self.matches[self.position]
-        self.position += 1
-        return item
-
-
-class SubMatchIterator(SequenceMatchIterator):
-    """
-
-    """
-
-    def __init__(self, closure, matches):
-        super().__init__(matches)
-        self._local = SequenceMatchIterator([])
-        self.closure = closure
-
-    def __next__(self):
-        while True:
-            try:
-                local = self._local.__next__()
-                return local
-            except StopIteration:
-                pass
-            match = self.closure(self.matches.__next__())
-            self._local = match
-
-
 class SequenceMatcher(Iterable):
     """
     The SequenceMatcher class will try to match a list of patterns and expressions and return all matches as an
@@ -923,19 +1517,20 @@ class SequenceMatcher(Iterable):
         self.patterns = patterns
         self.bindings = bindings
 
-    def _match(self, position=0, bindings=None):
-        if len(self.patterns) != len(self.expressions):
-            return SequenceMatchIterator([])
-
-        if bindings is None:
-            bindings = Bindings()
-        bindings = bindings.union(self.bindings)
-        if position >= len(self.patterns):
-            return SequenceMatchIterator([Match(bindings)])
+    def _match(self, position, bindings):
+        # Patterns with a single match are handled in place, only the others need a nested generator.
+        while position < len(self.patterns) and self.patterns[position].single:
+            bindings = self.patterns[position].single_match(self.expressions[position], bindings)
+            if bindings is None:
+                return
+            position += 1
 
-        match = self.patterns[position].match(self.expressions[position], bindings)
+        if position == len(self.patterns):
+            yield bindings
+            return
 
-        return SubMatchIterator(lambda m: self._match(position + 1, bindings.union(m.bindings)), match)
+        for b in self.patterns[position].match(self.expressions[position], bindings):
+            yield from self._match(position + 1, b)
 
     def __iter__(self):
         """
@@ -943,52 +1538,22 @@ class SequenceMatcher(Iterable):
 
         **Returns**:
 
-            ``An iterator over all possible matches.``
+            ``An iterator over the bindings of all possible matches.``
         """
-        return self._match()
-
-
-class MatchHelper:
-    """
-
-    """
-
-    @staticmethod
-    def _remove_element_that_matches(expressions, pattern):
-        number = -1
-        for i, element in enumerate(expressions):
-            if pattern.match(element, Bindings()):
-                number = i
-                break
-        if number != -1:
-            del expressions[number]
-            return True
-        return False
-
-    @staticmethod
-    def eliminate_constants(expressions, patterns):
-        constant_patterns = []
-        for pattern in patterns:
-            if pattern.constant:
-                constant_patterns.append(pattern)
-
-        for constant_pattern in constant_patterns:
-            if not MatchHelper._remove_element_that_matches(expressions, constant_pattern):
-                return False, None, None
-
-        return True, expressions, [pattern for pattern in patterns if pattern not in constant_patterns]
-
-    @staticmethod
-    # FIXME: Found the culprit! What the heck is wrong with this code? I hope that this code is in fact incorrect and
-    # FIXME: doesn't only show the bug.
-    def eliminate_bound_patterns(expressions, patterns, bindings):
-        return MatchHelper.eliminate_constants(expressions, patterns)
+        if len(self.patterns) != len(self.expressions):
+            return iter(())
+        return self._match(0, self.bindings)
 
 
 class OrderlessSequenceMatcher(Iterable):
     """
     The OrderlessSequenceMatcher class will try to match a list of patterns and a list of expressions and return all matches as
     an iterator. The lists can be reordered arbitrarily.
+
+    Instead of trying every ordering of the expressions, patterns are assigned to expressions by backtracking. Constant
+    patterns are removed first, the remaining patterns only try expressions with a fitting head and the patterns with the
+    fewest candidates are bound first. Equal expressions are only tried once per pattern, so no assignment is visited
+    twice.
     """
 
     def __init__(self, expressions, patterns, bindings):
@@ -997,52 +1562,69 @@ class OrderlessSequenceMatcher(Iterable):
         self.patterns = patterns
         self.bindings = bindings
 
+    @staticmethod
+    def _required_head(pattern):
+        if isinstance(pattern, BoundPattern):
+            pattern = pattern.base_pattern
+        if isinstance(pattern, Blank):
+            return pattern.head
+        if isinstance(pattern, Function) and isinstance(pattern.head, Expression) and pattern.head.constant:
+            return pattern.head
+        return None
+
+    def _candidates(self, pattern, expressions, groups):
+        if isinstance(pattern, BoundPattern) and pattern.name in self.bindings:
+            bound = self.bindings[pattern.name]
+            return [i for i, expression in enumerate(expressions) if expression == bound]
+        head = OrderlessSequenceMatcher._required_head(pattern)
+        if head is None:
+            return list(range(len(expressions)))
+        return groups.get(head, [])
+
+    def _assign(self, order, candidates, expressions, used, position, bindings):
+        if position == len(order):
+            yield bindings
+            return
+        pattern = self.patterns[order[position]]
+        tried = []
+        for i in candidates[order[position]]:
+            if used[i] or any(expressions[i] == expression for expression in tried):
+                continue
+            tried.append(expressions[i])
+            used[i] = True
+            for b in pattern.match(expressions[i], bindings):
+                yield from self._assign(order, candidates, expressions, used, position + 1, b)
+            used[i] = False
+
     def _match(self):
         if len(self.expressions) != len(self.patterns):
-            return SequenceMatchIterator([])
-
-        if len(self.patterns) == 0:
-            return SequenceMatchIterator(Match(self.bindings))
-
-        worked, expressions, patterns = MatchHelper.eliminate_bound_patterns(self.expressions, self.patterns,
-                                                                             self.bindings)
+            return
+
+        expressions = list(self.expressions)
+        variable_patterns = []
+        for index, pattern in enumerate(self.patterns):
+            if not pattern.constant:
+                variable_patterns.append(index)
+                continue
+            for i, expression in enumerate(expressions):
+                if pattern == expression:
+                    del expressions[i]
+                    break
+            else:
+                return
 
-        if not worked:
-            return SequenceMatchIterator([])
+        groups = {}
+        for i, expression in enumerate(expressions):
+            groups.setdefault(expression.head, []).append(i)
 
-        return OrderlessMatchIterator(expressions, patterns, self.bindings)
+        candidates = {index: self._candidates(self.patterns[index], expressions, groups) for index in variable_patterns}
+        order = sorted(variable_patterns, key=lambda index: len(candidates[index]))
+        yield from self._assign(order, candidates, expressions, [False] * len(expressions), 0, self.bindings)
 
     def __iter__(self):
         return self._match()
 
 
-class OrderlessMatchIterator(Iterator):
-    """
-
-    """
-
-    def __init__(self, expressions, patterns, bindings):
-        super().__init__()
-        self.expression_orderings = permutations(expressions)
-        self.patterns = patterns
-        self.bindings = bindings
-        self._local = SequenceMatchIterator([])
-
-    def __next__(self):
-        while True:
-            try:
-                local = self._local.__next__()
-                return local
-            except StopIteration:
-                pass
-
-            ordering = list(self.expression_orderings.__next__())
-
-            sm = SequenceMatcher(ordering, self.patterns, self.bindings)
-            matches = sm.__iter__()
-            self._local = matches
-
-
 class GroupingIterator(Iterator):
     """
 
@@ -1118,41 +1700,12 @@ class GroupingIterator(Iterator):
             raise StopIteration
 
 
-class FlatMatchIterator(Iterator):
-    """
-
-    """
-
-    def __init__(self, expressions, patterns, bindings, head):
-        super().__init__()
-        self.expression_groupings = GroupingIterator(expressions, patterns, head)
-        self.patterns = patterns
-        self.bindings = bindings
-        self._local = SequenceMatchIterator([])
-        self.head = head
-
-    def __next__(self):
-        while True:
-            try:
-                local = self._local.__next__()
-                return local
-            except StopIteration:
-                pass
-
-            grouping = self.expression_groupings.__next__()
-
-            new_expressions = [Function(self.head, Sequence(seq), [Attribute.Flat]) if len(seq) > 1 else seq[0] for seq in grouping if
-                               len(seq) != 0]
-
-            sm = SequenceMatcher(new_expressions, self.patterns, self.bindings)
-            matches = sm.__iter__()
-            self._local = matches
-
-
 class FlatSequenceMatcher(Iterable):
     """
     The FlatSequenceMatcher class will try to match a list of patterns and list of expressions and return all matches as
-    an iterator. The items in the lists can be grouped arbitrarily.
+    an iterator. The items in the lists can be grouped arbitrarily. The expressions have to be the arguments of a
+    function with the given head, in order, since groups of them are constructed as functions without normalizing
+    them.
     """
 
     def __init__(self, expressions, patterns, bindings, head):
@@ -1164,58 +1717,44 @@ class FlatSequenceMatcher(Iterable):
 
     def _match(self):
         if len(self.patterns) > len(self.expressions):
-            return SequenceMatchIterator([])
+            return
 
         if len(self.patterns) == 0:
             if len(self.expressions) == 0:
-                return SequenceMatchIterator([Match(self.bindings)])
-            else:
-                return SequenceMatchIterator([])
+                yield self.bindings
+            return
 
         if len(self.patterns) == len(self.expressions):
-            return SequenceMatcher(self.expressions, self.patterns, self.bindings).__iter__()
+            yield from SequenceMatcher(self.expressions, self.patterns, self.bindings)
+            return
 
         if len(self.patterns) == 1:
-            return self.patterns[0].match(Function(self.head, Sequence(self.expressions), [Attribute.Flat]), self.bindings)
+            yield from self.patterns[0].match(
+                Function(self.head, Sequence(self.expressions), Attribute.Flat, canonical=True), self.bindings)
+            return
 
-        return FlatMatchIterator(self.expressions, self.patterns, self.bindings, self.head)
+        for grouping in GroupingIterator(self.expressions, self.patterns, self.head):
+            expressions = [Function(self.head, Sequence(seq), Attribute.Flat, canonical=True) if len(seq) > 1 else
+                           seq[0] for seq in grouping if len(seq) != 0]
+            yield from SequenceMatcher(expressions, self.patterns, self.bindings)
 
     def __iter__(self):
         return self._match()
 
 
-class OrderlessFlatIterator(Iterator):
-    """
-
-    """
-
-    def __init__(self, expressions, patterns, bindings, head):
-        super().__init__()
-        self.expression_orderings = permutations(expressions)
-        self.patterns = patterns
-        self.bindings = bindings
-        self._local = SequenceMatchIterator([])
-        self.head = head
-
-    def __next__(self):
-        while True:
-            try:
-                local = self._local.__next__()
-                return local
-            except StopIteration:
-                pass
-
-            ordering = self.expression_orderings.__next__()
-
-            fm = FlatSequenceMatcher(ordering, self.patterns, self.bindings, self.head)
-            matches = fm.__iter__()
-            self._local = matches
-
-
 class OrderlessFlatSequenceMatcher(Iterable):
     """
     The OrderlessFlatSequenceMatcher class will try to match a list of patterns and list of expressions and return all
     matches as an iterator. The items in the lists can be grouped and reordered arbitrarily.
+
+    The expressions are treated as a multiset: equal expressions are counted instead of being permuted. Every constant
+    pattern takes one expression, and each remaining pattern takes a non-empty part of the multiset by multiplicity. A
+    part with more than one expression is matched as a function with the same head. Patterns that are already bound only
+    take the part their value consists of, patterns that require another head only take single expressions, and no
+    pattern takes so much that the patterns after it cannot be filled.
+
+    As with :py:class:`~expressions.FlatSequenceMatcher`, the expressions have to be the arguments of a function with
+    the given head, in order.
     """
 
     def __init__(self, expressions, patterns, bindings, head):
@@ -1225,28 +1764,122 @@ class OrderlessFlatSequenceMatcher(Iterable):
         self.bindings = bindings
         self.head = head
 
+    def _single(self, pattern):
+        # Returns whether the pattern can only match a single expression instead of a group.
+        if isinstance(pattern, BoundPattern):
+            pattern = pattern.base_pattern
+        if isinstance(pattern, Blank):
+            return pattern.head is not None and pattern.head != self.head
+        if isinstance(pattern, Function):
+            return isinstance(pattern.head, Expression) and pattern.head.constant and pattern.head != self.head
+        return isinstance(pattern, Expression)
+
+    def _group(self, elements, part):
+        expressions = []
+        for index, count in part:
+            expressions += [elements[index]] * count
+        if len(expressions) == 1:
+            return expressions[0]
+        # The elements are in the order of the expressions and the part lists them in order, so the group is sorted.
+        return Function(self.head, Sequence(expressions), Attribute.Flat, canonical=True)
+
+    def _bound_part(self, indices, value):
+        if isinstance(value, Function) and value.head == self.head:
+            values = value.argument_sequence.expressions
+        else:
+            values = [value]
+        part = {}
+        for value in values:
+            if value not in indices:
+                return None
+            part[indices[value]] = part.get(indices[value], 0) + 1
+        return sorted(part.items())
+
+    @staticmethod
+    def _parts(counts, size, start=0):
+        # Yields every sub-multiset of the given size as a list of (index, count) tuples.
+        if size == 0:
+            yield []
+            return
+        for index in range(start, len(counts)):
+            for count in range(min(counts[index], size), 0, -1):
+                for rest in OrderlessFlatSequenceMatcher._parts(counts, size - count, index + 1):
+                    yield [(index, count)] + rest
+
+    def _assign(self, patterns, capacities, multiplicities, elements, indices, counts, remaining, position, bindings):
+        if position == len(patterns):
+            if remaining == 0:
+                yield bindings
+            return
+        pattern = patterns[position]
+        rest = len(patterns) - position - 1
+
+        if isinstance(pattern, BoundPattern) and pattern.name in bindings:
+            part = self._bound_part(indices, bindings[pattern.name])
+            if part is None or any(counts[index] < count for index, count in part):
+                return
+            parts = [part]
+        elif rest == 0:
+            parts = [[(index, count) for index, count in enumerate(counts) if count > 0]]
+        else:
+            # A name that occurs again later needs its part once for every occurrence.
+            repeats = multiplicities[position]
+            available = [count // repeats for count in counts]
+            smallest = max(1, remaining - capacities[position + 1])
+            largest = 1 if self._single(pattern) else (remaining - rest + repeats - 1) // repeats
+            parts = (part for size in range(smallest, largest + 1) for part in self._parts(available, size))
+
+        for part in parts:
+            size = sum(count for _, count in part)
+            if size == 0 or (size > 1 and self._single(pattern)) or remaining - size < rest:
+                continue
+            for index, count in part:
+                counts[index] -= count
+            for b in pattern.match(self._group(elements, part), bindings):
+                yield from self._assign(patterns, capacities, multiplicities, elements, indices, counts,
+                                        remaining - size, position + 1, b)
+            for index, count in part:
+                counts[index] += count
+
     def _match(self):
         if len(self.patterns) > len(self.expressions):
-            return SequenceMatchIterator([])
+            return
 
-        if len(self.patterns) == 0:
-            if len(self.expressions) == 0:
-                return SequenceMatchIterator([Match(self.bindings)])
+        elements = []
+        indices = {}
+        counts = []
+        for expression in self.expressions:
+            if expression in indices:
+                counts[indices[expression]] += 1
             else:
-                return SequenceMatchIterator([])
-        else:
-            if len(self.expressions) == 0:
-                return SequenceMatchIterator([])
+                indices[expression] = len(elements)
+                elements.append(expression)
+                counts.append(1)
+
+        patterns = []
+        for pattern in self.patterns:
+            if not pattern.constant:
+                patterns.append(pattern)
+            elif pattern in indices and counts[indices[pattern]] > 0:
+                counts[indices[pattern]] -= 1
+            else:
+                return
 
-        if len(self.patterns) == len(self.expressions):
-            return OrderlessSequenceMatcher(self.expressions, self.patterns, self.bindings).__iter__()
+        # capacities[i] is the largest number of expressions the patterns from i onwards can take together.
+        capacities = [0] * (len(patterns) + 1)
+        for i in reversed(range(len(patterns))):
+            capacities[i] = capacities[i + 1] + (1 if self._single(patterns[i]) else len(self.expressions))
 
-        worked, self.expressions, self.patterns = MatchHelper.eliminate_bound_patterns(self.expressions, self.patterns,
-                                                                                       self.bindings)
-        if not worked:
-            return SequenceMatchIterator([])
+        multiplicities = []
+        for i, pattern in enumerate(patterns):
+            if isinstance(pattern, BoundPattern):
+                multiplicities.append(sum(1 for other in patterns[i:] if isinstance(other, BoundPattern) and
+                                          other.name == pattern.name))
+            else:
+                multiplicities.append(1)
 
-        return OrderlessFlatIterator(self.expressions, self.patterns, self.bindings, self.head)
+        yield from self._assign(patterns, capacities, multiplicities, elements, indices, counts, sum(counts), 0,
+                                self.bindings)
 
     def __iter__(self):
         return self._match()
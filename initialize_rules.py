@@ -1,3 +1,5 @@
+from operator import add, mul
+
 from expressions import Function, Symbol, Integer, Attribute, Sequence, BoundPattern, Blank, Complex, Number, Rational
 from evaluation import SubstitutionRule, LambdaRule, kernel
 
@@ -9,11 +11,18 @@ kernel.add_rule(SubstitutionRule(Function(Symbol('RealQ'), Sequence([Symbol('Pi'
 kernel.add_rule(LambdaRule(Function((Symbol('PositiveQ')), Sequence([BoundPattern('a', Blank(Symbol('Integer')))])), lambda b: Symbol('True') if b['a'].value > 0 else Symbol('False')))
 kernel.add_rule(LambdaRule(Function(Symbol('NonNegativeQ'), Sequence([BoundPattern('a', Blank(Symbol('Integer')))])), lambda b: Symbol('True') if b['a'].value >= 0 else Symbol('False')))
 
+kernel.add_predicate('ConstantQ', lambda a: a.has_attribute(Attribute.Constant))
+kernel.add_predicate('RealQ', lambda a: isinstance(a, Number) and not isinstance(a, Complex))
+kernel.add_predicate('PositiveQ', lambda a: isinstance(a, Integer) and a.value > 0)
+kernel.add_predicate('NonNegativeQ', lambda a: isinstance(a, Integer) and a.value >= 0)
+
+kernel.add_rule(LambdaRule(Function(Symbol('FreeQ'), Sequence([BoundPattern('a', Blank()), BoundPattern('b', Blank())])), lambda b: Symbol('True') if b['a'].free_of(b['b']) else Symbol('False')))
+kernel.add_predicate('FreeQ', lambda a, b: a.free_of(b))
+
 kernel.add_rule(SubstitutionRule(Rational(BoundPattern('a', Blank()), Integer(1)), Symbol('a')))
 
-kernel.add_rule(LambdaRule(Function(Symbol('Plus'), Sequence([BoundPattern('a', Blank(Symbol('Integer'))), BoundPattern('b', Blank(Symbol('Integer'))), BoundPattern('c', Blank())])), lambda b: Function('Plus', Sequence([b['a'] + b['b'], Symbol('c')]))))
-kernel.add_rule(LambdaRule(Function(Symbol('Plus'), Sequence([BoundPattern('a', Blank(Symbol('Integer'))), BoundPattern('b', Blank(Symbol('Integer')))])), lambda b: b['a'] + b['b']))
-kernel.add_rule(LambdaRule(Function(Symbol('Times'), Sequence([BoundPattern('a', Blank(Symbol('Integer'))), BoundPattern('b', Blank(Symbol('Integer')))])), lambda b: b['a'] * b['b']))
+kernel.add_folding('Plus', add)
+kernel.add_folding('Times', mul)
 kernel.add_rule(LambdaRule(Function(Symbol('Power'), Sequence([BoundPattern('a', Blank(Symbol('Integer'))), BoundPattern('b', Blank(Symbol('Integer')))])), lambda b: Integer(b['a'].value ** b['b'].value), [Function(Symbol('NonNegativeQ'), Sequence([Symbol('b')]))]))
 
 kernel.add_rule(SubstitutionRule(Function(Symbol('Plus'), Sequence([BoundPattern('a', Blank()), (Integer(0))])), Symbol('a')))
@@ -21,6 +30,8 @@ kernel.add_rule(SubstitutionRule(Function(Symbol('Plus'), Sequence([BoundPattern
 kernel.add_rule(SubstitutionRule(Function(Symbol('Plus'), Sequence([BoundPattern('a', Blank()), Function(Symbol('Times'), Sequence([BoundPattern('b', Blank()), BoundPattern('a', Blank())]))])), Function(Symbol('Times'), Sequence([Symbol('a'), Function('Plus', Sequence([Symbol('b'), Integer(1)]))]))))
 
 kernel.add_rule(SubstitutionRule(Function(Symbol('Times'), Sequence([Blank(), Integer(0)])), Integer(0)))
+# Folding Times[0, 1.5, x] gives Times[0., x], and a zero Real absorbs the other factors just like an exact zero.
+kernel.add_rule(SubstitutionRule(Function(Symbol('Times'), Sequence([BoundPattern('a', Blank(Symbol('Real'))), Blank()])), Symbol('a'), [lambda b: b['a'].value == 0]))
 
 kernel.add_rule(SubstitutionRule(Function(Symbol('Plus'), Sequence([BoundPattern('a', Blank()), BoundPattern('a', Blank()), BoundPattern('b', Blank())])), Function('Plus', Sequence([Symbol('b'), Function(Symbol('Times'), Sequence([Symbol('a'), Integer(2)]))]))))
 
@@ -33,6 +44,7 @@ kernel.add_rule(SubstitutionRule(Function((Symbol('Times')), Sequence([BoundPatt
 
 kernel.add_rule(SubstitutionRule(Function('Log', Sequence([Function('Power', Sequence([Symbol('E'), BoundPattern('a', Blank())]))])), Symbol('a'), [Function('RealQ', Sequence([Symbol('a')]))]))
 kernel.add_rule(SubstitutionRule(Function('Log', Sequence([Integer(1)])), Integer(0)))
+kernel.add_rule(SubstitutionRule(Function('Log', Sequence([BoundPattern('a', Blank()), BoundPattern('a', Blank())])), Integer(1)))
 kernel.add_rule(SubstitutionRule(Function('Log', Sequence([BoundPattern('a', Blank()), BoundPattern('b', Blank())])), Function('Times', Sequence([Function('Log', Sequence([Symbol('b')])), Function('Power', Sequence([Function('Log', Sequence([Symbol('a')])), Integer(-1)]))]))))
 kernel.add_rule(SubstitutionRule(Function('Log10', Sequence([BoundPattern('a', Blank())])), Function('Times', Sequence([Function('Log', Sequence([Symbol('a')])), Function('Power', Sequence([Function('Log', Sequence([Integer(10)])), Integer(-1)]))]))))
 kernel.add_rule(SubstitutionRule(Function('Log2', Sequence([BoundPattern('a', Blank())])), Function('Times', Sequence([Function('Log', Sequence([Symbol('a')])), Function('Power', Sequence([Function('Log', Sequence([Integer(2)])), Integer(-1)]))]))))
@@ -40,7 +52,7 @@ kernel.add_rule(SubstitutionRule(Function('Log2', Sequence([BoundPattern('a', Bl
 kernel.add_rule(SubstitutionRule(Function('D', Sequence([Function('Power', Sequence([BoundPattern('a', Blank()), BoundPattern('b', Blank())])), BoundPattern('x', Blank(Symbol('Symbol')))])), Function('Times', Sequence([Function('Power', Sequence([Symbol('a'), Symbol('b')])), Function('Plus', Sequence([Function('Times', Sequence([Symbol('b'), Function('D', Sequence([Symbol('a'), Symbol('x')])), Function('Power', Sequence([Symbol('a'), Integer(-1)]))])), Function('Times', Sequence([Function('D', Sequence([Symbol('b'), Symbol('x')])), Function('Log', Sequence([Symbol('a')]))]))]))]))))
 kernel.add_rule(SubstitutionRule(Function('D', Sequence([Function((Symbol('Times')), Sequence([BoundPattern('a', Blank()), BoundPattern('b', Blank())])), BoundPattern('x', Blank(Symbol('Symbol')))])), Function(Symbol('Plus'), Sequence([Function(Symbol('Times'), Sequence([Function(Symbol('D'), Sequence([Symbol('a'), Symbol('x')])), Symbol('b')])), Function(Symbol('Times'), Sequence([Function(Symbol('D'), Sequence([Symbol('b'), Symbol('x')])), Symbol('a')]))]))))
 kernel.add_rule(SubstitutionRule(Function('D', Sequence([Function((Symbol('Plus')), Sequence([BoundPattern('a', Blank()), BoundPattern('b', Blank())])), BoundPattern('x', Blank(Symbol('Symbol')))])), Function(Symbol('Plus'), Sequence([Function(Symbol('D'), Sequence([Symbol('a'), Symbol('x')])), Function(Symbol('D'), Sequence([Symbol('b'), Symbol('x')]))]))))
-kernel.add_rule(SubstitutionRule(Function('D', Sequence([BoundPattern('y', Blank()), BoundPattern('x', Blank(Symbol('Symbol')))])), Integer(0), [Function(Symbol('ConstantQ'), Sequence([Symbol('y')]))]))
+kernel.add_rule(SubstitutionRule(Function('D', Sequence([BoundPattern('y', Blank()), BoundPattern('x', Blank(Symbol('Symbol')))])), Integer(0), [Function(Symbol('FreeQ'), Sequence([Symbol('y'), Symbol('x')]))]))
 kernel.add_rule(SubstitutionRule(Function('D', Sequence([BoundPattern('x', Blank()), BoundPattern('x', Blank(Symbol('Symbol')))])), Integer(1)))
 kernel.add_rule(SubstitutionRule(Function('D', Sequence([BoundPattern('y', Blank(Symbol('Symbol'))), BoundPattern('x', Blank(Symbol('Symbol')))])), Integer(0)))
 kernel.add_rule(SubstitutionRule(Function('D', Sequence([Function((Symbol('Cos')), Sequence([BoundPattern('y', Blank())])), BoundPattern('x', Blank(Symbol('Symbol')))])), Function(Symbol('Times'), Sequence([Integer(-1), Function(Symbol('Sin'), Sequence([Symbol('y')])), Function(Symbol('D'), Sequence([Symbol('y'), Symbol('x')]))]))))
@@ -1,5 +1,5 @@
 from expressions import Function, Symbol, Integer, Sequence
-from time import clock
+from time import perf_counter as clock
 from initialize_rules import kernel
 
 
@@ -7,6 +7,7 @@ if __name__ == '__main__':
     exp = Function('D', Sequence([Function('Sin', Sequence([Function('Exp', Sequence([Function('Plus', Sequence([Integer(1), Symbol('a')]))]))])), Symbol('a')]))
 
     print(exp)
+    kernel.freeze()
     start = clock()
     kernel.evaluate_and_print(exp)
     print(clock() - start)
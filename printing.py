@@ -21,8 +21,7 @@ The pre-defined printers are:
         the ``LaTeXPrinter`` will yield ``\int {x}^{x} \mathrm{d} x``.
 """
 from collections import defaultdict
-from expressions import Symbol, Function, Integer, Real, Complex, Rational
-from copy import deepcopy
+from expressions import Symbol, Function, Sequence, Integer, Real, Complex, Rational
 
 # FIXME: This whole module is utterly broken. Complete recode, especially the LaTeXPrinter.
 
@@ -123,22 +122,20 @@ class LaTeXPrinter(Printer):
             if self._negative(expression):
                 return Integer(-1 * expression.value)
             else:
-                return Integer(expression.value)
+                return expression
         elif isinstance(expression, Real):
             if self._negative(expression):
                 return Real(-1.0 * expression.value)
             else:
-                return Real(expression.value)
+                return expression
         elif isinstance(expression, Function):
             if expression.head == Symbol('Times'):
-                argument_sequence.expressions = []
-                for argument in expression.argument_sequence.expressions:
-                    argument_sequence.expressions.append(self._as_non_negative(argument))
-                return Function(Symbol('Times'), argument_sequence.expressions)
+                return Function(Symbol('Times'), Sequence(
+                    [self._as_non_negative(argument) for argument in expression.argument_sequence.expressions]))
             else:
-                return deepcopy(expression)
+                return expression
         else:
-            return deepcopy(expression)
+            return expression
 
     def _to_string_integrate(self, expression):
         if isinstance(expression, Function) and expression.head == Symbol('Integrate') and len(
@@ -187,8 +184,7 @@ class LaTeXPrinter(Printer):
                 text += '}{'
                 for argument in expression.argument_sequence.expressions:
                     if isinstance(argument, Function) and argument.head == Symbol('Power') and self._negative(argument.argument_sequence.expressions[1]):
-                        new_argument = deepcopy(argument)
-                        new_argument.argument_sequence.expressions[1] = self._as_non_negative(new_argument.argument_sequence.expressions[1])
+                        new_argument = Function(argument.head, Sequence([argument.argument_sequence.expressions[0], self._as_non_negative(argument.argument_sequence.expressions[1])]))
                         if isinstance(new_argument.argument_sequence.expressions[1], Integer) and new_argument.argument_sequence.expressions[1].value == 1:
                             new_argument = new_argument.argument_sequence.expressions[0]
                         text += self._to_string(new_argument, self.precedence[expression.head]) + ' \\cdot '
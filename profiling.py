@@ -0,0 +1,144 @@
+"""
+The profiling module records how much work each rule of a :py:class:`~evaluation.Kernel` does. Profiling is turned on
+with :py:meth:`Kernel.enable_profiling<evaluation.Kernel.enable_profiling>`.
+"""
+import json
+
+
+class RuleProfile:
+    """
+    The counters and timers of a single rule. Times are in seconds and include the time spent in evaluations the rule
+    starts itself, such as the evaluation of its guards. The rebuild time is the time the kernel spends rebuilding the
+    functions above the rewrites of the rule from their evaluated parts. When several rules rewrite parts of a
+    function, rebuilding it counts for the rule that rewrote last.
+    """
+
+    # The fields in the order they are shown in tables and exported.
+    fields = ('attempts', 'matches', 'guard_evaluations', 'guard_failures', 'rewrites', 'match_time', 'guard_time',
+              'build_time', 'substitute_time', 'rebuild_time')
+
+    def __init__(self):
+        self.attempts = 0
+        self.matches = 0
+        self.guard_evaluations = 0
+        self.guard_failures = 0
+        self.rewrites = 0
+        self.match_time = 0.0
+        self.guard_time = 0.0
+        self.build_time = 0.0
+        self.substitute_time = 0.0
+        self.rebuild_time = 0.0
+
+    @property
+    def total_time(self):
+        return self.match_time + self.guard_time + self.build_time + self.substitute_time + self.rebuild_time
+
+    def to_dict(self):
+        """
+        Returns the counters and timers as a dictionary, including the total time.
+        """
+        values = {field: getattr(self, field) for field in RuleProfile.fields}
+        values['total_time'] = self.total_time
+        return values
+
+
+class Profiler:
+    """
+    Collects a :py:class:`~profiling.RuleProfile` for every rule the kernel tries. For every rule it counts
+
+        * the attempts to apply it,
+        * the matches of its pattern,
+        * the evaluations and failures of its guards and
+        * the rewrites it made,
+
+    and measures the time spent matching its pattern, evaluating its guards, running the code of a
+    :py:class:`~evaluation.LambdaRule`, substituting the bindings into the result and rebuilding the functions above
+    the rewritten expression.
+    """
+
+    def __init__(self):
+        self.profiles = {}
+
+    def profile(self, rule):
+        """
+        Returns the profile of a rule, creating an empty one the first time the rule is seen.
+
+        **Parameters:**
+
+            *rule* - The rule.
+
+        **Returns:**
+
+            The :py:class:`~profiling.RuleProfile` of the rule.
+        """
+        try:
+            return self.profiles[rule]
+        except KeyError:
+            profile = self.profiles[rule] = RuleProfile()
+            return profile
+
+    def sorted(self, key='total_time'):
+        """
+        Returns the profiled rules, the most expensive first.
+
+        **Parameters:**
+
+            *key* - The name of the counter or timer to sort by.
+
+        **Returns:**
+
+            A list of pairs of a rule and its profile.
+        """
+        return sorted(self.profiles.items(), key=lambda item: getattr(item[1], key), reverse=True)
+
+    def table(self, key='total_time', limit=None):
+        """
+        Formats the profile as a table with one line per rule, sorted by the given key. Times are in milliseconds.
+
+        **Parameters:**
+
+            *key* - The name of the counter or timer to sort by.
+
+            *limit* - The maximum number of rules to show or ``None`` to show all of them.
+
+        **Returns:**
+
+            The table as a string.
+        """
+        lines = ['%8s %8s %8s %8s %8s %9s %9s %9s %9s %9s %9s  %s' % (
+            'attempts', 'matches', 'guards', 'failed', 'rewrites', 'match', 'guard', 'build', 'subst', 'rebuild',
+            'total', 'rule')]
+        for rule, profile in self.sorted(key)[:limit]:
+            lines.append('%8d %8d %8d %8d %8d %9.3f %9.3f %9.3f %9.3f %9.3f %9.3f  %s' % (
+                profile.attempts, profile.matches, profile.guard_evaluations, profile.guard_failures, profile.rewrites,
+                profile.match_time * 1000, profile.guard_time * 1000, profile.build_time * 1000,
+                profile.substitute_time * 1000, profile.rebuild_time * 1000, profile.total_time * 1000, rule))
+        return '\n'.join(lines)
+
+    def to_json(self, key='total_time'):
+        """
+        Exports the profile as a JSON list with one object per rule, sorted by the given key. Every object holds the
+        string form of the rule under ``rule`` and its counters and timers. Times are in seconds.
+
+        **Parameters:**
+
+            *key* - The name of the counter or timer to sort by.
+
+        **Returns:**
+
+            The JSON document as a string.
+        """
+        return json.dumps([dict(rule=str(rule), **profile.to_dict()) for rule, profile in self.sorted(key)])
+
+    def reset(self):
+        """
+        Drops all profiles.
+
+        **Returns:**
+
+            ``None``
+        """
+        self.profiles.clear()
+
+    def __str__(self):
+        return self.table()
@@ -0,0 +1,62 @@
+"""
+Tests that freezing a rule set into a :py:class:`~evaluation.DiscriminationNet` doesn't change the results of
+evaluation. Run them from the root of the repository with ``python -m unittest discover tests``.
+"""
+import unittest
+from expressions import Function, Symbol, Integer, Sequence, BoundPattern, Blank, Attribute
+from evaluation import Kernel, SubstitutionRule
+from initialize_rules import kernel
+
+
+def f(head, *arguments, attributes=None):
+    return Function(head, Sequence(list(arguments)), attributes)
+
+
+def copy_kernel(rules, frozen):
+    # A kernel with the predicates, folding rules and the given rules of the default kernel.
+    copy = Kernel()
+    for head, predicate in kernel.predicates.items():
+        copy.add_predicate(head, predicate)
+    for head, rule in kernel.folding.items():
+        copy.add_folding(head, rule.operation)
+    for rule in rules:
+        copy.add_rule(rule)
+    if frozen:
+        copy.freeze()
+    return copy
+
+
+def attribute_rules():
+    # Rules whose patterns have attributes their head doesn't have, or lack attributes their head has.
+    a, b = BoundPattern('a', Blank()), BoundPattern('b', Blank())
+    return [SubstitutionRule(f('Bag', f('g', a), b, attributes=Attribute.Orderless), Symbol('orderless')),
+            SubstitutionRule(f('Chain', f('g', a), b, attributes=Attribute.Flat), Symbol('flat')),
+            SubstitutionRule(f('h', f('Bag', Integer(1), a, attributes=Attribute.Orderless)), Symbol('nested'))]
+
+
+class DiscriminationNetTest(unittest.TestCase):
+
+    def assert_same_results(self, rules, expressions):
+        unfrozen = copy_kernel(rules, False)
+        frozen = copy_kernel(rules, True)
+        for expression in expressions:
+            self.assertEqual(unfrozen.evaluate(expression), frozen.evaluate(expression), str(expression))
+
+    def test_explicit_attributes(self):
+        x, y = Symbol('x'), Symbol('y')
+        self.assert_same_results(attribute_rules(), [
+            f('Bag', y, f('g', x)), f('Bag', f('g', x), y), f('Chain', f('g', x), y, x),
+            f('h', f('Bag', x, Integer(1))), f('h', f('Bag', Integer(1), x))])
+        self.assertEqual(copy_kernel(attribute_rules(), True).evaluate(f('Bag', y, f('g', x))), Symbol('orderless'))
+
+    def test_bundled_rules(self):
+        x, one = Symbol('x'), Integer(1)
+        expressions = [f('D', f('Sin', f('Exp', f('Plus', one, x))), x), f('Log10', f('Log', one, one)),
+                       f('Plus', *[f('D', f('Times', f('Power', x, Integer(i)), f('Log', f('Plus', x, Integer(i)))), x)
+                                   for i in range(1, 4)]),
+                       f('Power', Integer(2), Integer(5)), f('Times', x, x, Symbol('y'))]
+        self.assert_same_results(kernel.rules + attribute_rules(), expressions)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Tests of :py:meth:`Kernel.evaluate<evaluation.Kernel.evaluate>` with the bundled rules. Run them from the root of the
+repository with ``python -m unittest discover tests``.
+"""
+import unittest
+from expressions import Function, Symbol, Integer, Sequence, BoundPattern, Blank, Attribute, attribute_table
+from evaluation import Kernel, LambdaRule, SubstitutionRule
+from initialize_rules import kernel
+
+
+def log(*arguments):
+    return Function('Log', Sequence(list(arguments)))
+
+
+def expressions():
+    # Expressions whose evaluation reuses parts already marked as being in normal form in new contexts.
+    one = Integer(1)
+    x = Symbol('x')
+    return [log(one, one), Function('Log10', Sequence([log(one, one)])),
+            Function('Times', Sequence([Symbol('b'), Function('Log10', Sequence([log(one, one)]))])),
+            Function('D', Sequence([Function('Sin', Sequence([Function('Exp', Sequence([
+                Function('Plus', Sequence([one, x]))]))])), x])),
+            Function('Plus', Sequence([Function('D', Sequence([Function('Times', Sequence([
+                Function('Power', Sequence([x, Integer(i)])), Function('Log', Sequence([
+                    Function('Plus', Sequence([x, Integer(i)]))]))])), x])) for i in range(1, 4)]))]
+
+
+class EvaluationTest(unittest.TestCase):
+
+    def test_parts_first(self):
+        # Evaluating the parts first turns Log[1] into 0 before the quotient Log[1] / Log[1] is simplified, unless the
+        # rules handle Log[a, a] themselves. The results are those of the evaluator that applied the rules to the
+        # whole expression first.
+        one = Integer(1)
+        self.assertEqual(kernel.evaluate(log(one, one)), one)
+        self.assertEqual(kernel.evaluate(Function('Log10', Sequence([log(one, one)]))), Integer(0))
+        self.assertEqual(kernel.evaluate(log(Symbol('x'), Symbol('x'))), one)
+
+    def test_normal_form_marks(self):
+        # Evaluating with the marks left by earlier evaluations gives the same results as evaluating without marks.
+        warm = [kernel.evaluate(expression) for expression in expressions()]
+        cold = []
+        for expression in expressions():
+            kernel.invalidate()
+            cold.append(kernel.evaluate(expression))
+        self.assertEqual([str(result) for result in warm], [str(result) for result in cold])
+
+    def test_rule_in_two_kernels(self):
+        # Adding the rules to other kernels leaves the guards of the default kernel evaluated by the default kernel.
+        for rule in kernel.rules:
+            Kernel().add_rule(rule)
+        power = Function('Power', Sequence([Integer(2), Integer(5)]))
+        self.assertEqual(kernel.evaluate(power), Integer(32))
+
+    def test_attributes_changed_by_another_kernel(self):
+        # The attribute table is shared, so changing it through one kernel makes the others forget their results.
+        swap = Kernel()
+        pattern = Function('Swap', Sequence([BoundPattern('a', Blank()), BoundPattern('b', Blank())]))
+        swap.add_rule(LambdaRule(pattern, lambda b: Function('Bag', Sequence([b['b'], b['a']]))))
+        swap.enable_cache()
+        expression = Function('Swap', Sequence([Symbol('x'), Symbol('y')]))
+        self.assertEqual(str(swap.evaluate(expression)), 'Bag[y, x]')
+        try:
+            Kernel().set_attributes('Bag', Attribute.Orderless)
+            self.assertEqual(str(swap.evaluate(expression)), 'Bag[x, y]')
+            attribute_table.set('Bag', 0)
+            self.assertEqual(str(swap.evaluate(expression)), 'Bag[y, x]')
+        finally:
+            attribute_table.set('Bag', 0)
+
+    def test_predicate_added_later(self):
+        # Expressions left alone because a guard failed are rewritten once a predicate makes the guard hold.
+        checked = Kernel()
+        pattern = Function('Check', Sequence([BoundPattern('a', Blank())]))
+        checked.add_rule(SubstitutionRule(pattern, Symbol('passed'), [Function('Good', Sequence([Symbol('a')]))]))
+        checked.enable_cache()
+        expression = Function('Check', Sequence([Symbol('x')]))
+        self.assertEqual(checked.evaluate(expression), expression)
+        checked.add_predicate('Good', lambda argument: True)
+        self.assertEqual(checked.evaluate(expression), Symbol('passed'))
+
+    def test_head_made_orderless_later(self):
+        # Functions built from a Bag constructed before Bag was made Orderless are sorted, by substitution as well as by
+        # the templates of rules.
+        bag = Function('Bag', Sequence([Symbol('y'), Symbol('x')]))
+        swap = Kernel()
+        pattern = Function('Swap', Sequence([BoundPattern('a', Blank()), BoundPattern('b', Blank())]))
+        swap.add_rule(SubstitutionRule(pattern, Function('Bag', Sequence([Symbol('b'), Symbol('a')]))))
+        try:
+            attribute_table.set('Bag', Attribute.Orderless)
+            self.assertEqual(str(bag.substitute({'y': Symbol('z')})), 'Bag[x, z]')
+            self.assertEqual(str(swap.evaluate(Function('Swap', Sequence([Symbol('x'), Symbol('y')])))), 'Bag[x, y]')
+        finally:
+            attribute_table.set('Bag', 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
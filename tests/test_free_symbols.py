@@ -0,0 +1,49 @@
+"""
+Tests of :py:meth:`~expressions.Expression.free_symbols`, :py:meth:`~expressions.Expression.free_of` and the rules
+that use them. Run them from the root of the repository with ``python -m unittest discover tests``.
+"""
+import unittest
+from expressions import Function, Symbol, Integer, Rational, Sequence
+from initialize_rules import kernel
+
+
+def f(head, *arguments):
+    return Function(head, Sequence(list(arguments)))
+
+
+class FreeSymbolsTest(unittest.TestCase):
+
+    def test_free_symbols(self):
+        x, y = Symbol('x'), Symbol('y')
+        self.assertEqual(x.free_symbols(), frozenset([x]))
+        self.assertEqual(Integer(3).free_symbols(), frozenset())
+        self.assertEqual(Rational(Integer(1), Integer(2)).free_symbols(), frozenset())
+        # The heads of functions are symbols of the expression as well.
+        self.assertEqual(f('g', f('Sin', x), Integer(1), y).free_symbols(),
+                         frozenset([Symbol('g'), Symbol('Sin'), x, y]))
+
+    def test_free_of(self):
+        x, y = Symbol('x'), Symbol('y')
+        expression = f('g', f('Sin', x), Integer(2))
+        self.assertFalse(expression.free_of(x))
+        self.assertTrue(expression.free_of(y))
+        self.assertFalse(expression.free_of(f('Sin', x)))
+        self.assertTrue(expression.free_of(f('Sin', y)))
+        self.assertFalse(expression.free_of(Integer(2)))
+
+    def test_free_q(self):
+        x, y = Symbol('x'), Symbol('y')
+        self.assertEqual(kernel.evaluate(f('FreeQ', f('g', y), x)), Symbol('True'))
+        self.assertEqual(kernel.evaluate(f('FreeQ', f('g', x), x)), Symbol('False'))
+
+    def test_derivative_free_of_variable(self):
+        # Derivatives of expressions free of the variable are 0, even if they aren't constant.
+        x, y = Symbol('x'), Symbol('y')
+        self.assertEqual(kernel.evaluate(f('D', f('g', Integer(0), y), x)), Integer(0))
+        self.assertEqual(kernel.evaluate(f('D', f('Sin', y), x)), Integer(0))
+        self.assertEqual(kernel.evaluate(f('D', Integer(3), x)), Integer(0))
+        self.assertEqual(kernel.evaluate(f('D', f('g', Integer(0), x), x)), f('D', f('g', Integer(0), x), x))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+Tests of the arithmetic of :py:class:`~expressions.Number` and of folding numbers with
+:py:class:`~evaluation.FoldingRule`. Run them from the root of the repository with
+``python -m unittest discover tests``.
+"""
+import unittest
+from expressions import Function, Symbol, Integer, Rational, Real, Complex, Sequence
+from initialize_rules import kernel
+
+
+def rational(numerator, denominator):
+    return Rational(Integer(numerator), Integer(denominator))
+
+
+def f(head, *arguments):
+    return Function(head, Sequence(list(arguments)))
+
+
+class NumberTest(unittest.TestCase):
+
+    def test_exact_division(self):
+        self.assertIs(Integer(6) / Integer(3), Integer(2))
+        self.assertIs(Integer(1) / Integer(3), rational(1, 3))
+        self.assertIs(Integer(2) / Integer(-4), rational(-1, 2))
+        self.assertIs(rational(1, 2) / rational(1, 4), Integer(2))
+        self.assertIs(Integer(1) / Real(4.0), Real(0.25))
+        with self.assertRaises(ZeroDivisionError):
+            Integer(1) / Integer(0)
+
+    def test_big_integers(self):
+        # Numbers with thousands of digits stay exact.
+        big = Integer(3 ** 20000)
+        self.assertIs(big * Integer(7) / Integer(7), big)
+        self.assertIs(rational(3 ** 20000, 3 ** 19999), rational(3, 1))
+        self.assertIs(rational(3 ** 20000 + 1, 3 ** 20000) + rational(-1, 3 ** 20000), Integer(1))
+
+    def test_small_integers(self):
+        # The small integers are taken from a table, all others are interned as usual.
+        for value in (-128, 0, 1, 1023):
+            self.assertIs(Integer.of(value), Integer(value))
+            self.assertIs(Integer(value) + Integer(0), Integer(value))
+        for value in (-129, 1024, 10 ** 30):
+            self.assertIs(Integer.of(value), Integer(value))
+
+    def test_rationals(self):
+        self.assertIs(rational(2, 4), rational(1, 2))
+        self.assertIs(rational(2, -4), rational(-1, 2))
+        self.assertIs(rational(1, 3) + rational(1, 6), rational(1, 2))
+        self.assertIs(rational(2, 3) * rational(3, 2), Integer(1))
+        self.assertIs(rational(1, 2) + Real(0.25), Real(0.75))
+
+    def test_zero_denominator(self):
+        # Rationals with a zero denominator are kept as they are and aren't exact numbers.
+        for numerator in (0, 1, 2):
+            infinite = rational(numerator, 0)
+            self.assertEqual(infinite.numerator, Integer(numerator))
+            self.assertEqual(infinite.denominator, Integer(0))
+            self.assertIsNone(infinite._exact())
+        self.assertIsNot(rational(2, 0), rational(1, 0))
+
+    def test_complex(self):
+        # Complex numbers with rational parts stay exact, and a zero imaginary part gives a real number.
+        i = Complex(Integer(0), Integer(1))
+        self.assertIs(i * i, Integer(-1))
+        self.assertEqual(str(Complex(Integer(1), Integer(2)) + rational(1, 2)), 'Complex[Rational[3, 2], 2]')
+        self.assertEqual(str(Complex(Integer(1), Integer(1)) / Integer(2)),
+                         'Complex[Rational[1, 2], Rational[1, 2]]')
+
+
+class FoldingTest(unittest.TestCase):
+
+    def assert_evaluates(self, expression, result):
+        self.assertEqual(str(kernel.evaluate(expression)), result)
+
+    def test_integers(self):
+        x = Symbol('x')
+        self.assert_evaluates(f('Plus', *[Integer(i) for i in range(1, 1001)]), '500500')
+        self.assert_evaluates(f('Times', Integer(-1), Integer(2), x), 'Times[-2, x]')
+        self.assert_evaluates(f('Times', Integer(3), Integer(0), x), '0')
+
+    def test_widest_type(self):
+        x = Symbol('x')
+        self.assert_evaluates(f('Plus', rational(1, 2), rational(1, 3), x), 'Plus[Rational[5, 6], x]')
+        self.assert_evaluates(f('Plus', rational(1, 2), rational(1, 2)), '1')
+        self.assert_evaluates(f('Plus', Integer(1), Real(0.5), x), 'Plus[1.5, x]')
+        self.assert_evaluates(f('Plus', Complex(Integer(1), Integer(2)), rational(1, 2), x),
+                              'Plus[Complex[Rational[3, 2], 2], x]')
+        self.assert_evaluates(f('Times', Complex(Integer(0), Integer(1)), Complex(Integer(0), Integer(1)), x),
+                              'Times[-1, x]')
+
+    def test_real_zero(self):
+        # A zero Real absorbs the other factors like an exact zero does.
+        x, y = Symbol('x'), Symbol('y')
+        self.assert_evaluates(f('Times', Integer(0), Real(1.5), x), '0.0')
+        self.assert_evaluates(f('Times', Real(0.0), x, y), '0.0')
+        self.assert_evaluates(f('Times', Real(2.0), x), 'Times[2.0, x]')
+
+    def test_zero_denominator(self):
+        # Rationals with a zero denominator aren't folded.
+        self.assert_evaluates(f('Plus', Integer(1), Integer(2), rational(1, 0)), 'Plus[3, Rational[1, 0]]')
+        self.assert_evaluates(f('Times', Integer(2), Integer(3), rational(1, 0)), 'Times[6, Rational[1, 0]]')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+Differential tests of :py:class:`~expressions.OrderlessSequenceMatcher` against the permutation engine it replaced.
+Run them from the root of the repository with ``python -m unittest discover tests``.
+"""
+import random
+import unittest
+from itertools import permutations
+from expressions import Function, Symbol, Integer, Sequence, BoundPattern, Blank, Bindings, \
+    OrderlessSequenceMatcher
+
+
+def permutation_matches(expressions, patterns, bindings):
+    """
+    The engine the backtracking matcher replaced: the patterns are matched in order against every permutation of the
+    expressions.
+
+    **Returns:**
+
+        The set of all matches, each as a frozenset of (name, expression) tuples.
+    """
+    matches = set()
+    if len(patterns) != len(expressions):
+        return matches
+    for ordering in set(permutations(expressions)):
+        matches.update(_sequence_matches(list(ordering), patterns, bindings))
+    return matches
+
+
+def _sequence_matches(values, patterns, bindings):
+    # Matches the patterns against the values in order.
+    if len(patterns) == 0:
+        yield frozenset(bindings.items())
+        return
+    for match in patterns[0].match(values[0], bindings):
+        yield from _sequence_matches(values[1:], patterns[1:], match)
+
+
+def backtracking_matches(expressions, patterns, bindings):
+    """
+    Runs the backtracking matcher on the expressions in canonical order, as the arguments of a function would be.
+    """
+    arguments = list(Sequence(expressions).sort().expressions)
+    return {frozenset(match.items()) for match in OrderlessSequenceMatcher(arguments, patterns, bindings)}
+
+
+def arguments():
+    # Candidate arguments, with repeated heads and equal expressions.
+    return [Symbol('x'), Symbol('y'), Integer(1), Integer(2), Function('g', Sequence([Symbol('x')])),
+            Function('g', Sequence([Integer(1)])), Function('h', Sequence([Symbol('x'), Symbol('y')]))]
+
+
+def patterns():
+    # Candidate patterns, with repeated names, patterns restricted to a head and constant patterns.
+    return [BoundPattern('a', Blank()), BoundPattern('a', Blank()), BoundPattern('b', Blank()), Blank(),
+            BoundPattern('a', Blank(Symbol('Integer'))), BoundPattern('c', Blank(Symbol('Symbol'))),
+            Function('g', Sequence([BoundPattern('a', Blank())])),
+            Function('h', Sequence([BoundPattern('a', Blank()), BoundPattern('e', Blank())])), Integer(1),
+            Symbol('x')]
+
+
+class OrderlessSequenceMatcherTest(unittest.TestCase):
+
+    def assert_same_matches(self, expressions, pattern_list, bindings=Bindings()):
+        expected = permutation_matches(expressions, pattern_list, bindings)
+        actual = backtracking_matches(expressions, pattern_list, bindings)
+        self.assertEqual(expected, actual, 'matching %s against %s' % (
+            [str(pattern) for pattern in pattern_list], [str(expression) for expression in expressions]))
+
+    def test_repeated_names(self):
+        x, y = Symbol('x'), Symbol('y')
+        a, b = BoundPattern('a', Blank()), BoundPattern('b', Blank())
+        self.assert_same_matches([x, x, y], [a, a, b])
+        self.assert_same_matches([x, y, x, y], [a, a, b, b])
+        self.assert_same_matches([x, y, y], [a, a, a])
+
+    def test_nested_bindings(self):
+        x, one = Symbol('x'), Integer(1)
+        g = Function('g', Sequence([BoundPattern('a', Blank())]))
+        self.assert_same_matches([Function('g', Sequence([x])), Function('g', Sequence([one])), one, x],
+                                 [g, BoundPattern('a', Blank()), Blank(), Blank()])
+
+    def test_bound_names(self):
+        x, y = Symbol('x'), Symbol('y')
+        bindings = Bindings().bind('a', y)
+        self.assert_same_matches([x, y, x], [BoundPattern('a', Blank()), BoundPattern('b', Blank()), Blank()],
+                                 bindings)
+
+    def test_random(self):
+        generator = random.Random(3)
+        candidates = arguments()
+        pattern_candidates = patterns()
+        for size in range(1, 6):
+            for _ in range(60):
+                expressions = [generator.choice(candidates) for _ in range(size)]
+                pattern_list = [generator.choice(pattern_candidates) for _ in range(size)]
+                self.assert_same_matches(expressions, pattern_list)
+
+
+if __name__ == '__main__':
+    unittest.main()
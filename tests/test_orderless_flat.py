@@ -0,0 +1,111 @@
+"""
+Differential tests of :py:class:`~expressions.OrderlessFlatSequenceMatcher` against the brute-force engine it replaced.
+Run them from the root of the repository with ``python -m unittest discover tests``.
+"""
+import random
+import unittest
+from itertools import combinations, permutations
+from expressions import Function, Symbol, Integer, Sequence, BoundPattern, Blank, Bindings, \
+    OrderlessFlatSequenceMatcher
+
+
+def brute_force_matches(expressions, patterns, bindings, head):
+    """
+    The engine the multiset matcher replaced: every pattern is matched against a group of consecutive expressions, for
+    every grouping of every permutation of the expressions. A group with more than one expression is matched as a
+    function with the given head.
+
+    **Returns:**
+
+        The set of all matches, each as a frozenset of (name, expression) tuples.
+    """
+    matches = set()
+    if len(patterns) == 0:
+        if len(expressions) == 0:
+            matches.add(frozenset(bindings.items()))
+        return matches
+    for ordering in set(permutations(expressions)):
+        for cuts in combinations(range(1, len(ordering)), len(patterns) - 1):
+            bounds = (0,) + cuts + (len(ordering),)
+            groups = [ordering[bounds[i]:bounds[i + 1]] for i in range(len(patterns))]
+            values = [group[0] if len(group) == 1 else Function(head, Sequence(group)) for group in groups]
+            matches.update(_sequence_matches(values, patterns, bindings))
+    return matches
+
+
+def _sequence_matches(values, patterns, bindings):
+    # Matches the patterns against the values in order.
+    if len(patterns) == 0:
+        yield frozenset(bindings.items())
+        return
+    for match in patterns[0].match(values[0], bindings):
+        yield from _sequence_matches(values[1:], patterns[1:], match)
+
+
+def multiset_matches(expressions, patterns, bindings, head):
+    """
+    Runs the multiset matcher on the expressions in canonical order, as the arguments of a function would be.
+    """
+    arguments = list(Sequence(expressions).sort().expressions)
+    return {frozenset(match.items()) for match in OrderlessFlatSequenceMatcher(arguments, patterns, bindings, head)}
+
+
+def arguments(head):
+    # Candidate arguments of a function with the given head. None of them has the head itself.
+    other = Symbol('Times') if head == Symbol('Plus') else Symbol('Plus')
+    return [Symbol('x'), Symbol('y'), Symbol('z'), Integer(1), Integer(2), Function('g', Sequence([Symbol('x')])),
+            Function(other, Sequence([Symbol('x'), Symbol('y')]))]
+
+
+def patterns(head):
+    # Candidate patterns, with repeated names, patterns that take a group of arguments and constant patterns.
+    other = Symbol('Times') if head == Symbol('Plus') else Symbol('Plus')
+    return [BoundPattern('a', Blank()), BoundPattern('a', Blank()), BoundPattern('b', Blank()), Blank(),
+            BoundPattern('a', Blank(Symbol('Integer'))), BoundPattern('c', Blank(Symbol('Symbol'))),
+            BoundPattern('d', Blank(head)), Function('g', Sequence([BoundPattern('a', Blank())])),
+            Function(other, Sequence([BoundPattern('a', Blank()), BoundPattern('e', Blank())])), Integer(1),
+            Symbol('x')]
+
+
+class OrderlessFlatSequenceMatcherTest(unittest.TestCase):
+
+    def assert_same_matches(self, expressions, pattern_list, head, bindings=Bindings()):
+        expected = brute_force_matches(expressions, pattern_list, bindings, head)
+        actual = multiset_matches(expressions, pattern_list, bindings, head)
+        self.assertEqual(expected, actual, 'matching %s against %s' % (
+            [str(pattern) for pattern in pattern_list], [str(expression) for expression in expressions]))
+
+    def test_repeated_names(self):
+        x, y, z = Symbol('x'), Symbol('y'), Symbol('z')
+        a, b = BoundPattern('a', Blank()), BoundPattern('b', Blank())
+        self.assert_same_matches([x, x, y, y, z], [a, a, b], Symbol('Plus'))
+        self.assert_same_matches([x, x, x, x], [a, a], Symbol('Times'))
+        self.assert_same_matches([x, y, x, y], [a, a], Symbol('Plus'))
+
+    def test_groups(self):
+        x, y, z = Symbol('x'), Symbol('y'), Symbol('z')
+        a, b = BoundPattern('a', Blank()), BoundPattern('b', Blank())
+        self.assert_same_matches([x, y, z, Integer(2)], [a, b], Symbol('Plus'))
+        self.assert_same_matches([x, y, z], [BoundPattern('d', Blank(Symbol('Times'))), b], Symbol('Times'))
+
+    def test_bound_names(self):
+        x, y = Symbol('x'), Symbol('y')
+        bindings = Bindings().bind('a', Function('Plus', Sequence([x, y])))
+        self.assert_same_matches([x, y, x, y], [BoundPattern('a', Blank()), BoundPattern('b', Blank())],
+                                 Symbol('Plus'), bindings)
+
+    def test_random(self):
+        generator = random.Random(7)
+        for head in (Symbol('Plus'), Symbol('Times')):
+            candidates = arguments(head)
+            pattern_candidates = patterns(head)
+            for size in range(1, 6):
+                for count in range(1, 5):
+                    for _ in range(15):
+                        expressions = [generator.choice(candidates) for _ in range(size)]
+                        pattern_list = [generator.choice(pattern_candidates) for _ in range(count)]
+                        self.assert_same_matches(expressions, pattern_list, head)
+
+
+if __name__ == '__main__':
+    unittest.main()
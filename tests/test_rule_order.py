@@ -0,0 +1,67 @@
+"""
+Tests of :py:meth:`Kernel.save_rule_order<evaluation.Kernel.save_rule_order>` and
+:py:meth:`Kernel.load_rule_order<evaluation.Kernel.load_rule_order>`. Run them from the root of the repository with
+``python -m unittest discover tests``.
+"""
+import os
+import tempfile
+import unittest
+from expressions import Function, Symbol, Integer, Sequence, BoundPattern, Blank
+from evaluation import Kernel, SubstitutionRule
+from profiling import Profiler
+
+
+def derivative_rules():
+    # Rules whose string forms are all D[BoundPattern[y], BoundPattern[x]] -> 0.
+    def rule(head, guards=None):
+        return SubstitutionRule(Function('D', Sequence([BoundPattern('y', Blank(head)), BoundPattern('x', Blank())])),
+                                Integer(0), guards)
+    return [rule(Symbol('Integer')), rule(Symbol('Real')), rule(Symbol('Rational'))]
+
+
+def new_kernel():
+    kernel = Kernel()
+    for rule in derivative_rules():
+        kernel.add_rule(rule)
+    return kernel
+
+
+class RuleOrderTest(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_rules_with_the_same_string_form(self):
+        tuned = new_kernel()
+        profiler = Profiler()
+        for hits, rule in zip((1, 5, 3), tuned.rules):
+            profiler.profile(rule).rewrites = hits
+        tuned.reorder_rules(profiler)
+        tuned.save_rule_order(self.path)
+        loaded = new_kernel()
+        loaded.load_rule_order(self.path)
+        self.assertEqual([rule.description() for rule in loaded.rules], [rule.description() for rule in tuned.rules])
+        heads = [str(rule.pattern.argument_sequence.expressions[0].base_pattern.head) for rule in loaded.rules]
+        self.assertEqual(heads, ['Real', 'Rational', 'Integer'])
+
+    def test_other_rules(self):
+        new_kernel().save_rule_order(self.path)
+        other = Kernel()
+        for rule in reversed(derivative_rules()):
+            other.add_rule(rule)
+        with self.assertRaises(ValueError):
+            other.load_rule_order(self.path)
+
+    def test_rule_added_twice(self):
+        kernel = new_kernel()
+        kernel.add_rule(kernel.rules[0])
+        with self.assertRaises(ValueError):
+            kernel.save_rule_order(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+The tracing module contains tracers that record the rewrites made by :py:class:`~evaluation.Kernel`. A tracer is
+registered by assigning it to ``kernel.tracer``. Without a tracer the kernel does not do any work for tracing.
+"""
+import json
+from collections import deque
+
+
+class Tracer:
+    """
+    Base class for all tracers. The kernel calls :py:meth:`~tracing.Tracer.rewrite` for every rewrite it makes and
+    passes references to the rule and the expressions involved. Tracers should avoid formatting them unless they have
+    to.
+    """
+
+    def rewrite(self, rule, position, before, after):
+        """
+        Records a rewrite. This method should be overwritten by anyone subclassing this class.
+
+        **Parameters:**
+
+            *rule* - The rule that was applied.
+
+            *position* - The position of the rewritten subexpression in the evaluated expression as a list of indices.
+            Index 0 is the head of a function and the indices of its arguments start at 1.
+
+            *before* - The subexpression the rule was applied to.
+
+            *after* - The result of the rule.
+
+        **Returns:**
+
+            ``None``
+        """
+        pass
+
+
+class RingBufferTracer(Tracer):
+    """
+    Keeps the most recent rewrites in memory. Every rewrite is stored as a tuple ``(rule, position, before, after)``
+    and once *capacity* rewrites are stored the oldest ones are dropped.
+    """
+
+    def __init__(self, capacity=1000):
+        self.rewrites = deque(maxlen=capacity)
+
+    def rewrite(self, rule, position, before, after):
+        self.rewrites.append((rule, position, before, after))
+
+    def clear(self):
+        """
+        Removes all stored rewrites.
+
+        **Returns:**
+
+            ``None``
+        """
+        self.rewrites.clear()
+
+    def __iter__(self):
+        return iter(self.rewrites)
+
+    def __len__(self):
+        return len(self.rewrites)
+
+
+class JsonLinesTracer(Tracer):
+    """
+    Writes every rewrite as a JSON object on a line of its own, with the keys ``rule``, ``position``, ``before`` and
+    ``after``. The rule and the expressions are converted to strings.
+
+    **Parameters:**
+
+        *file* - A path or an open text file. A path is opened for appending and closed by
+        :py:meth:`~tracing.JsonLinesTracer.close`.
+    """
+
+    def __init__(self, file):
+        if isinstance(file, str):
+            self.file = open(file, 'a')
+            self.owned = True
+        else:
+            self.file = file
+            self.owned = False
+
+    def rewrite(self, rule, position, before, after):
+        self.file.write(json.dumps({'rule': str(rule), 'position': position, 'before': str(before),
+                                    'after': str(after)}) + '\n')
+
+    def close(self):
+        """
+        Closes the file if the tracer opened it.
+
+        **Returns:**
+
+            ``None``
+        """
+        if self.owned:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()